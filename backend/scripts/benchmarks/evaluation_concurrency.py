@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+evaluation_concurrency.py
+
+- Fires N concurrent EvaluationService.evaluate_answer calls through the whole service stack
+  (trait gate, cache, scheduler, retries), with Gemini replaced by a coroutine that takes
+  --call-seconds to answer, so the check is deterministic and runs offline
+- Meanwhile a heartbeat coroutine ticks every 10 ms and records how late each tick fires
+- If evaluation blocked the event loop, the worst tick delay would be about as long as a Gemini call;
+  if calls were serialized, the wall time would be about N times one call
+
+Run from the backend/ folder so the app settings (.env) are picked up:
+    python scripts/benchmarks/evaluation_concurrency.py --calls 5
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.services.evaluation_service import EvaluationService  # noqa: E402
+
+TICK_SECONDS = 0.01
+FAKE_RESULT = {
+    "trait": "academic_strengths",
+    "label": "Numbers Person",
+    "label_description": "You light up when a problem has a clean, logical answer.",
+    "confidence": 0.8,
+    "evidence": "I really like maths and physics",
+}
+
+
+def slow_generate_content(call_seconds: float):
+    async def generate_content(**kwargs):
+        # Stands in for a Gemini call: waits without holding the event loop
+        await asyncio.sleep(call_seconds)
+        return SimpleNamespace(text=json.dumps(FAKE_RESULT), parsed=FAKE_RESULT, usage_metadata=None)
+    return generate_content
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - start - TICK_SECONDS)
+
+
+async def main(calls: int, max_lag_ms: float, call_seconds: float):
+    service = EvaluationService()
+    service.gemini.client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+        generate_content=slow_generate_content(call_seconds)
+    )))
+    stop = asyncio.Event()
+    lags: list = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+
+    start = time.perf_counter()
+    # Distinct answers, so the evaluation cache doesn't answer any of them
+    results = await asyncio.gather(*[
+        service.evaluate_answer("What subjects do you enjoy the most at school?", f"I really like maths and physics, {i}")
+        for i in range(calls)
+    ])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+
+    worst = max(lags) * 1000 if lags else 0.0
+    print(f"{calls} evaluations in {elapsed:.2f}s at {call_seconds}s per call ({sum(1 for r in results if r)} with a trait)")
+    print(f"heartbeat ticks: {len(lags)}, worst event loop lag: {worst:.1f} ms")
+    failed = False
+    if worst > max_lag_ms:
+        print(f"✗ event loop was blocked for more than {max_lag_ms} ms")
+        failed = True
+    if calls > 1 and elapsed > call_seconds * 2:
+        print(f"✗ evaluations did not run concurrently ({elapsed:.2f}s for {calls} calls)")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✓ evaluations ran concurrently and the event loop kept serving")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--max-lag-ms", type=float, default=100.0)
+    parser.add_argument("--call-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.max_lag_ms, args.call_seconds))
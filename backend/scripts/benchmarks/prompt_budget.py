@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+prompt_budget.py
+
+- Builds the per-turn conversation prompt for a long-running synthetic profile
+  (every trait with full evidence history, 200 stored chat messages, 10 recommendations)
+- Checks the prompt stays under a fixed size budget, that stored chat history and
+  recommendations are not serialized into it, and that the conversation appears exactly once
+- Offline: no Gemini or Mongo calls are made
+
+Run from the backend/ folder so the app settings (.env) are picked up:
+    python scripts/benchmarks/prompt_budget.py --budget 4000
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.models.pydantic.profile import Profile, Trait, ChatMessage, fold_trait  # noqa: E402
+from src.services.conversation_service import ConversationService  # noqa: E402
+
+CONVERSATION_TURNS = 10
+
+
+def long_profile(service: ConversationService) -> Profile:
+    user_id = ObjectId()
+    now = datetime.utcnow()
+    traits = {}
+    for key in service.get_required_traits():
+        for i in range(10):
+            trait = Trait(trait=key, label=f"Label {i}", label_description="A vivid description " * 5,
+                          confidence=0.5 + i / 25, evidence="Some evidence the user gave " * 3, timestamp=now)
+            traits[key] = fold_trait(traits.get(key), trait)
+    history = [ChatMessage(role="user" if i % 2 else "assistant", content=f"stored message {i} " * 10, timestamp=now)
+               for i in range(200)]
+    recs = [{"course": f"Course {i}", "course_fit": 1, "matched_traits": ["Label 9"], "reason": "Because " * 10}
+            for i in range(10)]
+    return Profile(_id=user_id, user_id=user_id, traits=traits, updated_at=now,
+                   chat_history=history, courses_recommendation=recs)
+
+
+def main(budget: int):
+    service = ConversationService()
+    profile = long_profile(service)
+    conversation = [{"role": "user" if i % 2 else "assistant", "content": f"recent turn {i}"}
+                    for i in range(CONVERSATION_TURNS)]
+    prompt = service._build_prompt(profile, conversation)
+
+    failures = []
+    if len(prompt) > budget:
+        failures.append(f"prompt is {len(prompt)} chars, budget is {budget}")
+    if "stored message" in prompt:
+        failures.append("stored chat history is serialized into the prompt")
+    if "Course 0" in prompt:
+        failures.append("course recommendations are serialized into the prompt")
+    if prompt.count("recent turn 3") != 1:
+        failures.append("conversation does not appear exactly once")
+
+    print(f"per-turn prompt: {len(prompt)} chars (+ {len(service.static_prefix)} chars static prefix)")
+    for f in failures:
+        print(f"✗ {f}")
+    if failures:
+        sys.exit(1)
+    print("✓ prompt within budget")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=4000)
+    args = parser.parse_args()
+    main(args.budget)
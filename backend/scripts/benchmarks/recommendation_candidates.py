@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+recommendation_candidates.py
+
+- Runs course recommendations for a set of profiles twice: with the whole catalog in the
+  prompt (the previous behaviour) and with only the top-K locally pre-ranked candidates
+- Reports, per profile and on average, the top-10 overlap between the two, how many of the
+  full-catalog picks were inside the local top-K (candidate recall), and the prompt sizes
+- Profiles are built-in synthetic students, or sampled from the profiles collection with --from-db
+- Calls Gemini (2 requests per profile); the recommendation cache is bypassed
+- With --offline, no Gemini call is made: for each synthetic profile, reports how many of the
+  courses a counsellor would expect made the local shortlist, and each one's rank
+
+Run from the backend/ folder so the app settings (.env) are picked up:
+    python scripts/benchmarks/recommendation_candidates.py --candidates 30
+    python scripts/benchmarks/recommendation_candidates.py --from-db 20
+    python scripts/benchmarks/recommendation_candidates.py --offline
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.services.recommendation_service import RecommendationService  # noqa: E402
+from src.services.profile_service import ProfileService  # noqa: E402
+
+
+def trait(key, label, evidence, confidence=0.8):
+    return {"trait": key, "label": label, "label_description": label, "evidence": evidence, "confidence": confidence}
+
+
+SYNTHETIC_PROFILES = [
+    [trait("academic_strengths", "Mathematics", "I like maths and solving puzzles"),
+     trait("goal", "Software developer", "I want to build apps one day")],
+    [trait("academic_strengths", "Art and design", "I enjoy drawing and design in my free time"),
+     trait("learning_style", "Hands-on", "I learn best when I can try things hands-on")],
+    [trait("goal", "Doctor", "I want to help sick people and work in a hospital"),
+     trait("academic_strengths", "Biology", "Biology and chemistry are my best subjects")],
+    [trait("goal", "Run my own business", "I want to start a company"),
+     trait("personality_orientation", "Extroverted", "I love meeting new people"),
+     trait("financial_need_level", "High", "Money is a bit tight for my family")],
+    [trait("academic_strengths", "Writing", "I write stories and articles for the school magazine"),
+     trait("motivation", "Curiosity", "I like understanding how society works")],
+    [trait("goal", "Engineer", "I like fixing machines and building robots"),
+     trait("academic_strengths", "Physics", "Physics is my favourite subject")],
+]
+
+# Courses that clearly belong in each synthetic profile's recommendations, for the offline check
+EXPECTED_COURSES = [
+    ["Computer Science", "Software Engineering", "Information Technology (IT)", "Mathematics"],
+    ["Graphic Design", "Industrial Design", "Creative Arts", "Interior Design"],
+    ["Medicine", "Nursing", "Dentistry", "Medical Sciences", "Pharmacy", "Biology"],
+    ["Entrepreneurship", "Business Administration", "Marketing", "International Business"],
+    ["Journalism", "Mass Communication", "Social Sciences", "English"],
+    ["Mechanical Engineering", "Mechatronics Engineering", "Physics", "Electrical Engineering"],
+]
+
+
+def offline(candidates: int):
+    service = RecommendationService()
+    recalls = []
+    for i, (traits, expected) in enumerate(zip(SYNTHETIC_PROFILES, EXPECTED_COURSES)):
+        shortlist = service.candidates(traits, candidates)
+        offered = {c["course"] for c in shortlist}
+        ranks = {service.fields_of_study[j]["course"]: r + 1 for r, (_, j) in enumerate(service.index.score(traits))}
+        recall = len(offered & set(expected)) / len(expected)
+        recalls.append(recall)
+        detail = ", ".join(f"{c} #{ranks[c]}" for c in expected)
+        print(f"profile {i + 1}: {len(shortlist)} candidates, expected-course recall {recall:.0%} ({detail})")
+    print(f"mean expected-course recall {statistics.mean(recalls):.0%} at top-{candidates}")
+
+
+async def load_profiles(service: RecommendationService, from_db: int):
+    if not from_db:
+        return SYNTHETIC_PROFILES
+    cursor = ProfileService().collection.find(
+        {"traits": {"$ne": {}}}, {"traits": 1}
+    ).limit(from_db)
+    return [service.profile_traits(doc) async for doc in cursor]
+
+
+async def main(candidates: int, from_db: int):
+    service = RecommendationService()
+    service.cache.collection = None  # always ask Gemini
+    profiles = await load_profiles(service, from_db)
+
+    overlaps, recalls = [], []
+    for i, traits in enumerate(profiles):
+        profile = {"traits": {t["trait"]: t for t in traits}}
+        full = await service.recommend_courses(profile, candidates=0, fallback=False)
+        shortlisted = await service.recommend_courses(profile, candidates=candidates, fallback=False)
+        full_courses = {r["course"] for r in full}
+        short_courses = {r["course"] for r in shortlisted}
+        local_top = {c["course"] for c in service.candidates(traits, candidates)}
+        if not full_courses:
+            print(f"profile {i + 1}: no full-catalog recommendations, skipped")
+            continue
+        overlap = len(full_courses & short_courses) / len(full_courses)
+        recall = len(full_courses & local_top) / len(full_courses)
+        overlaps.append(overlap)
+        recalls.append(recall)
+        print(f"profile {i + 1}: top-10 overlap {overlap:.0%}, candidate recall {recall:.0%}")
+
+    sample = profiles[0]
+    full_prompt = len(service.static_prefix) + len(service.build_prompt(sample, service.candidates(sample, 0)))
+    short_prompt = len(service.static_prefix) + len(service.build_prompt(sample, service.candidates(sample, candidates)))
+    print(f"prompt size: {full_prompt} chars full catalog, {short_prompt} chars with top-{candidates} "
+          f"({full_prompt / short_prompt:.1f}x smaller)")
+    if overlaps:
+        print(f"mean top-10 overlap {statistics.mean(overlaps):.0%}, "
+              f"mean candidate recall {statistics.mean(recalls):.0%} over {len(overlaps)} profiles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=30)
+    parser.add_argument("--from-db", type=int, default=0, help="Sample this many stored profiles instead of the synthetic ones")
+    parser.add_argument("--offline", action="store_true", help="Check the local shortlist only, without calling Gemini")
+    args = parser.parse_args()
+    if args.offline:
+        offline(args.candidates)
+    else:
+        asyncio.run(main(args.candidates, args.from_db))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+stream_overhead.py
+
+- Streams the same prompt through GeminiService.stream_response and through the raw async SDK stream
+- Reports time to first chunk, mean gap between chunks and the wrapper's per-chunk overhead
+- Repeats at increasing concurrency and reports wall time and the peak number of OS threads,
+  which should stay flat because streaming uses no dedicated thread or executor hop
+
+Run from the backend/ folder so the app settings (.env) are picked up:
+    python scripts/benchmarks/stream_overhead.py --levels 1 10 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.services.gemini_service import GeminiService  # noqa: E402
+from src.services.llm_router import llm_router  # noqa: E402
+
+PROMPT = "In about 150 words, describe what studying computer science at university is like."
+
+
+async def raw_stream(gemini: GeminiService, contents):
+    # Same model and settings as stream_response's default "conversation" task
+    model, config = llm_router.route("conversation")
+    response = await gemini.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+
+async def timed(stream) -> dict:
+    start = time.perf_counter()
+    stamps = []
+    async for _ in stream:
+        stamps.append(time.perf_counter())
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    return {
+        "ttft": stamps[0] - start if stamps else float("nan"),
+        "chunks": len(stamps),
+        "gap": statistics.mean(gaps) if gaps else 0.0,
+        "total": (stamps[-1] - start) if stamps else 0.0,
+    }
+
+
+async def sample_threads(stop: asyncio.Event, peak: list):
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        await asyncio.sleep(0.01)
+
+
+async def main(levels: list):
+    gemini = GeminiService()
+
+    wrapped = await timed(gemini.stream_response([PROMPT]))
+    raw = await timed(raw_stream(gemini, [PROMPT]))
+    print("single stream        ttft     chunks  mean gap")
+    for name, r in (("stream_response", wrapped), ("raw SDK", raw)):
+        print(f"{name:<20} {r['ttft']*1000:7.0f}ms {r['chunks']:6d} {r['gap']*1000:8.1f}ms")
+    print(f"per-chunk overhead ≈ {(wrapped['gap'] - raw['gap'])*1000:.2f} ms (noise from the API dominates)\n")
+
+    print("concurrency  wall      p50 ttft  p95 ttft  peak threads")
+    for n in levels:
+        stop = asyncio.Event()
+        peak = [threading.active_count()]
+        sampler = asyncio.create_task(sample_threads(stop, peak))
+        start = time.perf_counter()
+        results = await asyncio.gather(*[timed(gemini.stream_response([PROMPT])) for _ in range(n)])
+        wall = time.perf_counter() - start
+        stop.set()
+        await sampler
+        ttfts = sorted(r["ttft"] for r in results)
+        p95 = ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))]
+        print(f"{n:<12} {wall:6.2f}s  {statistics.median(ttfts)*1000:7.0f}ms {p95*1000:7.0f}ms  {peak[0]:6d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+    asyncio.run(main(args.levels))
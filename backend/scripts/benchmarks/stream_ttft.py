@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+stream_ttft.py
+
+- Sends chat turns to /api/v1/orchestrator/stream-turn of a running backend
+- Measures time to first reply token (TTFT), time to the alert event and total stream time
+- Understands both the SSE framing (`event: chunk` / `event: alert`) and the older
+  "JSON alert line, then raw text" framing, so the same run can compare before and after
+- The turns are real: they are saved to the chat history of the token's user
+
+Usage:
+    python scripts/benchmarks/stream_ttft.py --base-url http://localhost:8000 --token <access token> --turns 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+MESSAGES = [
+    "I like maths and solving puzzles",
+    "I learn best when I can try things hands-on",
+    "I want to work somewhere I can travel",
+    "Money is a bit tight for my family",
+    "I enjoy drawing and design in my free time",
+]
+
+
+async def one_turn(client: httpx.AsyncClient, message: str) -> dict:
+    start = time.perf_counter()
+    ttft = alert_at = None
+    buffer = ""
+    legacy_header_done = False
+    async with client.stream("POST", "/api/v1/orchestrator/stream-turn", json={"message": message, "conversation_history": []}) as r:
+        r.raise_for_status()
+        async for text in r.aiter_text():
+            now = time.perf_counter() - start
+            buffer += text
+            if buffer.startswith("event:") or "\nevent:" in buffer:
+                if ttft is None and "event: chunk" in buffer:
+                    ttft = now
+                if alert_at is None and "event: alert" in buffer:
+                    alert_at = now
+            else:
+                # Legacy framing: the first line is the alert JSON, everything after is reply text
+                if not legacy_header_done and "\n" in buffer:
+                    legacy_header_done = True
+                    alert_at = now
+                    buffer = buffer.split("\n", 1)[1]
+                if legacy_header_done and ttft is None and buffer:
+                    ttft = now
+    return {"ttft": ttft, "alert": alert_at, "total": time.perf_counter() - start}
+
+
+async def main(base_url: str, token: str, turns: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=120) as client:
+        results = []
+        for i in range(turns):
+            r = await one_turn(client, MESSAGES[i % len(MESSAGES)])
+            results.append(r)
+            print(f"turn {i + 1}: ttft {r['ttft'] * 1000:.0f}ms, alert {r['alert'] * 1000:.0f}ms, total {r['total'] * 1000:.0f}ms")
+    ttfts = [r["ttft"] for r in results if r["ttft"] is not None]
+    if ttfts:
+        print(f"median TTFT {statistics.median(ttfts) * 1000:.0f}ms over {len(ttfts)} turns")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.token, args.turns))
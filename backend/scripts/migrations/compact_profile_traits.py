@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+compact_profile_traits.py
+
+- Finds profiles whose `traits` is still the legacy append-only list
+- Rewrites them into the keyed form (one entry per trait, best label + capped evidence history)
+- Uses the same server-side expression as ProfileService.merge_trait, so it is safe to re-run
+
+Run from the backend/ folder so the app settings (.env) are picked up:
+    python scripts/migrations/compact_profile_traits.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.services.profile_service import ProfileService  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    service = ProfileService()
+    remaining = await service.collection.count_documents({"traits": {"$type": "array"}})
+    logger.info(f"Found {remaining} profiles with legacy trait lists")
+    if not remaining:
+        return
+    modified = await service.compact_legacy_traits()
+    logger.info(f"✓ Compacted traits on {modified} profiles")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
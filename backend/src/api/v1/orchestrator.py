@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from bson import ObjectId
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from src.services.orchestrator_service import OrchestratorService
 from src.api.v1.auth import get_current_user
-from src.services.profile_service import ProfileService
 from src.services.conversation_service import ConversationService
+from src.services.idempotency_service import IdempotencyService, IdempotencyConflict, IdempotencyMismatch
+from src.services.stream_buffer import StreamBuffer, stream_registry
+from src.core.metrics import metrics
 import time
+import json
+import asyncio
 from datetime import datetime
 from src.models.pydantic.profile import ChatMessage, Alert
 import logging
@@ -15,12 +19,13 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 orchestrator_service = OrchestratorService()
-profile_service = ProfileService()
 conversation_service = ConversationService()
+idempotency_service = IdempotencyService()
 
 class OrchestratorMessageRequest(BaseModel):
     message: str
     conversation_history: List[Dict[str, Any]] = Field(default_factory=list, description="List of conversation messages so far, each with role and content.")
+    session_id: Optional[str] = Field(default=None, description="Server-side session id. When set, the server keeps the conversation window and conversation_history can be omitted.")
 
 class OrchestratorMessageResponse(BaseModel):
     next_turn: str
@@ -29,108 +34,343 @@ class OrchestratorMessageResponse(BaseModel):
 
 # Remove the /message endpoint and its related code
 
+async def _begin_idempotent(request: Request, user_id: ObjectId, user_message: str) -> Optional[dict]:
+    """
+    Take the Idempotency-Key record for this message, if the client sent a key.
+    The record's `alert` is set once the user message was saved and evaluated, and its
+    `assistant_text` once the reply was; a repeated call reuses both instead of redoing them.
+    """
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        return None
+    try:
+        return await idempotency_service.begin(user_id, key, user_message)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    except IdempotencyMismatch:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different message")
+
+def _stored_alerts(record: Optional[dict]) -> Optional[List[Alert]]:
+    if record is None or record.get("alert") is None:
+        return None
+    return [Alert(**a) for a in record["alert"]]
+
 @router.post("/turn")
 async def next_turn(request: Request, current_user=Depends(get_current_user)):
+    record = None
     try:
         body = await request.json()
         user_id = ObjectId(str(current_user["_id"]))
-        conversation_history = body.get("conversation_history", [])
         user_message = body.get("message", "")
-
-        result = await orchestrator_service.process_user_message(
+        session_id = body.get("session_id")
+        record = await _begin_idempotent(request, user_id, user_message)
+        if record and record.get("assistant_text") is not None:
+            return {
+                "assistant_text": record["assistant_text"],
+                "alert": record["alert"],
+                "session_id": session_id
+            }
+        alert_list = _stored_alerts(record)
+        conversation_history = await orchestrator_service.resolve_conversation(
             user_id,
             user_message,
-            conversation_history
+            body.get("conversation_history", []),
+            session_id,
+            message_saved=alert_list is not None
         )
-        profile = result["profile"]
-        alert_data = result.get("alert", [])
-        alert_list = []
-        if alert_data and isinstance(alert_data, list):
-            alert_list = [Alert(**a) if isinstance(a, dict) else a for a in alert_data]
-
-        # Generate the full assistant response (non-streaming)
-        assistant_text = await conversation_service.next_turn(profile, conversation_history)
+
+        turn = await orchestrator_service.begin_turn(user_id)
+        if alert_list is not None:
+            # The message was already saved and evaluated under this key (e.g. by /alert-info)
+            assistant_text = await conversation_service.next_turn(turn.profile, conversation_history)
+        else:
+            orchestrator_service.record_user_message(turn, user_message)
+            # Evaluate the message while generating the full assistant response (non-streaming)
+            # from the profile as it stood before this message
+            profile = turn.profile.model_copy(deep=True)
+            evaluation = asyncio.create_task(
+                orchestrator_service.evaluate_user_message(turn, user_message, conversation_history)
+            )
+            try:
+                assistant_text = await conversation_service.next_turn(profile, conversation_history)
+            except Exception:
+                # No reply, but the user message and its trait update are still saved; a retry
+                # under the same Idempotency-Key then only generates the reply
+                alert_list = await evaluation
+                await orchestrator_service.commit_turn(turn, session_id)
+                if record:
+                    await idempotency_service.save(record, alert=[a.dict() for a in alert_list])
+                raise
+            alert_list = await evaluation
         msg = ChatMessage(
             role="assistant",
             content=assistant_text,
             timestamp=datetime.utcnow(),
             alert=alert_list
         )
-        await profile_service.append_chat_history(user_id, msg)
+        turn.append_chat_history(msg)
+        await orchestrator_service.commit_turn(turn, session_id)
+        alerts = [a.dict() for a in alert_list]
+        if record:
+            await idempotency_service.save(record, alert=alerts, assistant_text=assistant_text)
         return {
             "assistant_text": assistant_text,
-            "alert": [a.dict() for a in alert_list]
+            "alert": alerts,
+            "session_id": session_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /turn: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to get next turn")
+    finally:
+        if record:
+            await idempotency_service.release(record)
+
+# Comment line sent when a stream has had no event for this long, so proxies keep the connection open
+STREAM_HEARTBEAT_SECONDS = 15
+
+def _sse(buffer: StreamBuffer, seq: int, event: str, data: dict) -> str:
+    """
+    Frame one server-sent event. Stream events are `start` (the stream id), `chunk` (reply text),
+    `alert` (the turn's alerts, sent whenever evaluation finishes) and `done`. The event id is
+    `<stream_id>:<seq>`, so a client can resume from its Last-Event-ID.
+    """
+    return f"id: {buffer.stream_id}:{seq}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _consume(buffer: StreamBuffer, after: int = 0):
+    """
+    Send the stream's buffered events after sequence `after`, then follow it live until `done`,
+    with heartbeats while nothing happens. Disconnecting only detaches from the buffer.
+    """
+    buffer.attach()
+    try:
+        while True:
+            for seq, event, data in buffer.since(after):
+                after = seq
+                yield _sse(buffer, seq, event, data)
+            if buffer.done and after >= len(buffer.events):
+                return
+            if not await buffer.wait(after, STREAM_HEARTBEAT_SECONDS):
+                yield ": heartbeat\n\n"
+    finally:
+        buffer.detach()
+
+def _stream_response(buffer: StreamBuffer, after: int = 0) -> StreamingResponse:
+    return StreamingResponse(
+        _consume(buffer, after),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": buffer.stream_id, "Cache-Control": "no-cache"}
+    )
+
+async def _resolved(value):
+    return value
 
 @router.post("/stream-turn")
 async def stream_next_turn(request: Request, current_user=Depends(get_current_user)):
+    started = time.perf_counter()
+    record = None
+    producing = False
     try:
         body = await request.json()
         user_id = ObjectId(str(current_user["_id"]))
-        conversation_history = body.get("conversation_history", [])
         user_message = body.get("message", "")
-
-        result = await orchestrator_service.process_user_message(
+        session_id = body.get("session_id")
+        record = await _begin_idempotent(request, user_id, user_message)
+        buffer = stream_registry.create(user_id)
+        buffer.append("start", {"stream_id": buffer.stream_id})
+        if record and record.get("assistant_text") is not None:
+            # Re-stream the reply stored under this Idempotency-Key
+            buffer.append("alert", {"alert": record["alert"]})
+            buffer.append("chunk", {"text": record["assistant_text"]})
+            buffer.append("done", {})
+            buffer.finish()
+            return _stream_response(buffer)
+        stored_alerts = _stored_alerts(record)
+        conversation_history = await orchestrator_service.resolve_conversation(
             user_id,
             user_message,
-            conversation_history
+            body.get("conversation_history", []),
+            session_id,
+            message_saved=stored_alerts is not None
         )
-        profile = result["profile"]
-        alert_data = result.get("alert", [])
-        alert_list = []
-        if alert_data and isinstance(alert_data, list):
-            alert_list = [Alert(**a) if isinstance(a, dict) else a for a in alert_data]
-
-        async def event_generator_and_save():
-            import json
-            assistant_chunks = []
-            # Yield alert info as the first chunk (always an array)
-            yield json.dumps({"alert": [a.dict() for a in alert_list]}) + "\n"
-            async for chunk in conversation_service.stream_next_turn(profile, conversation_history):
-                assistant_chunks.append(chunk)
-                yield chunk
-            # Only insert the assistant message here
+
+        turn = await orchestrator_service.begin_turn(user_id)
+        if stored_alerts is not None:
+            # The message was already saved and evaluated under this key (e.g. by /alert-info)
+            profile = turn.profile
+            evaluation = asyncio.create_task(_resolved(stored_alerts))
+        else:
+            orchestrator_service.record_user_message(turn, user_message)
+            # The reply starts streaming from the profile as it stood before this message while the
+            # message is evaluated in parallel; the evaluation's alerts follow as their own event
+            profile = turn.profile.model_copy(deep=True)
+            evaluation = asyncio.create_task(
+                orchestrator_service.evaluate_user_message(turn, user_message, conversation_history)
+            )
+
+        async def finish_turn(assistant_text: str, truncated: bool) -> None:
+            # The user message, trait update and assistant message are written together here
+            alert_list = await evaluation
             msg = ChatMessage(
                 role="assistant",
-                content=''.join(assistant_chunks),
+                content=assistant_text,
                 timestamp=datetime.utcnow(),
-                alert=alert_list
+                alert=alert_list,
+                truncated=truncated
             )
-            await profile_service.append_chat_history(user_id, msg)
-        return StreamingResponse(event_generator_and_save(), media_type="text/event-stream")
+            turn.append_chat_history(msg)
+            await orchestrator_service.commit_turn(turn, session_id)
+            if record:
+                # A cut-off reply isn't stored, so a retry under the same key generates it again
+                stored = {"alert": [a.dict() for a in alert_list]}
+                if not truncated:
+                    stored["assistant_text"] = assistant_text
+                await idempotency_service.save(record, **stored)
+
+        async def produce():
+            """
+            Generate the reply into the buffer, independently of any connection. Generation is
+            cancelled only once no client has been attached for the resume grace period.
+            """
+            assistant_chunks = []
+            completed = False
+            alert_sent = False
+            reply = conversation_service.stream_next_turn(profile, conversation_history, cancel_event=buffer.cancel_event)
+            next_chunk = asyncio.ensure_future(reply.__anext__())
+            try:
+                while True:
+                    waiting = {next_chunk} if alert_sent else {next_chunk, evaluation}
+                    done, _ = await asyncio.wait(waiting, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+                    if buffer.abandoned() and not buffer.cancel_event.is_set():
+                        logger.info(f"No client attached to stream {buffer.stream_id}, stopping generation")
+                        buffer.cancel_event.set()
+                    if not alert_sent and evaluation in done:
+                        alert_sent = True
+                        buffer.append("alert", {"alert": [a.dict() for a in evaluation.result()]})
+                    if next_chunk in done:
+                        try:
+                            chunk = next_chunk.result()
+                        except StopAsyncIteration:
+                            break
+                        if not assistant_chunks:
+                            logger.info(f"TTFT {(time.perf_counter() - started) * 1000:.0f}ms for user_id={user_id}")
+                        assistant_chunks.append(chunk)
+                        buffer.append("chunk", {"text": chunk})
+                        next_chunk = asyncio.ensure_future(reply.__anext__())
+                if not alert_sent:
+                    alert_sent = True
+                    buffer.append("alert", {"alert": [a.dict() for a in await evaluation]})
+                completed = not buffer.cancel_event.is_set()
+            except Exception as e:
+                logger.error(f"Stream {buffer.stream_id} failed: {e}", exc_info=True)
+            finally:
+                if not next_chunk.done():
+                    next_chunk.cancel()
+                if not completed:
+                    logger.info(f"Stream {buffer.stream_id} ended early for user_id={user_id}, saving partial reply")
+                try:
+                    await finish_turn(''.join(assistant_chunks), not completed)
+                finally:
+                    if record:
+                        await idempotency_service.release(record)
+                    buffer.append("done", {"truncated": not completed})
+                    buffer.finish()
+                    stream_registry.touch(buffer)
+
+        buffer.producer = asyncio.create_task(produce())
+        producing = True
+        return _stream_response(buffer)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Streaming error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to stream next turn")
+    finally:
+        # Once producing, the producer releases the key when it finishes
+        if record and not producing:
+            await idempotency_service.release(record)
+
+@router.get("/stream-turn/resume")
+async def resume_stream(
+    request: Request,
+    stream_id: Optional[str] = Query(None, description="Stream id from the `start` event or X-Stream-Id header."),
+    last_seq: int = Query(0, ge=0, description="Sequence number of the last event received."),
+    current_user=Depends(get_current_user)
+):
+    """
+    Continue a stream after a dropped connection: sends every event after `last_seq`, then
+    follows the stream live if it is still generating. A `Last-Event-ID` header
+    (`<stream_id>:<seq>`) takes precedence over the query parameters.
+    """
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id and ":" in last_event_id:
+        stream_id, seq = last_event_id.rsplit(":", 1)
+        last_seq = int(seq) if seq.isdigit() else 0
+    if not stream_id:
+        raise HTTPException(status_code=400, detail="stream_id or Last-Event-ID is required")
+    buffer = stream_registry.get(stream_id, ObjectId(str(current_user["_id"])))
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    metrics.incr("stream_resumes")
+    return _stream_response(buffer, after=last_seq)
 
 @router.post("/alert-info")
 async def alert_info(request: Request, current_user=Depends(get_current_user)):
+    record = None
     try:
         body = await request.json()
         user_id = ObjectId(str(current_user["_id"]))
-        conversation_history = body.get("conversation_history", [])
         user_message = body.get("message", "")
+        session_id = body.get("session_id")
+        record = await _begin_idempotent(request, user_id, user_message)
+        if record and record.get("alert") is not None:
+            profile = await orchestrator_service.profile_service.get_profile(user_id, include_chat_history=False)
+            return {
+                "alert": record["alert"],
+                "profile": profile.dict(by_alias=True) if profile else None,
+                "session_id": session_id
+            }
+        conversation_history = await orchestrator_service.resolve_conversation(
+            user_id,
+            user_message,
+            body.get("conversation_history", []),
+            session_id
+        )
+        turn = await orchestrator_service.begin_turn(user_id)
         result = await orchestrator_service.process_user_message(
             user_id,
             user_message,
-            conversation_history
+            conversation_history,
+            turn=turn
         )
+        await orchestrator_service.commit_turn(turn, session_id)
+        if record:
+            await idempotency_service.save(record, alert=[a.dict() for a in result["alert"]])
         return {
             "alert": result.get("alert"),
-            "profile": result["profile"].dict(by_alias=True)
+            "profile": result["profile"].dict(by_alias=True),
+            "session_id": session_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Alert info error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to get alert info")
+    finally:
+        if record:
+            await idempotency_service.release(record)
 
 @router.get("/history")
-async def get_chat_history(current_user=Depends(get_current_user)):
+async def get_chat_history(
+    before: Optional[int] = Query(None, ge=0, description="Cursor from a previous page; returns messages older than this position."),
+    limit: int = Query(50, ge=1, le=200),
+    current_user=Depends(get_current_user)
+):
     try:
         user_id = ObjectId(str(current_user["_id"]))
-        conversations = await orchestrator_service.get_chat_history(user_id)
-        return {"conversations": conversations}
+        conversations, next_before = await orchestrator_service.get_chat_history_page(user_id, before=before, limit=limit)
+        return {"conversations": conversations, "next_before": next_before}
     except Exception as e:
         logger.error(f"Error getting chat history: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to get chat history")
@@ -14,4 +14,4 @@ async def get_profile_traits(current_user=Depends(get_current_user)):
     profile = await service.get_profile(user_id)
     if not profile:
         return []
-    return profile.traits
+    return list(profile.traits.values())
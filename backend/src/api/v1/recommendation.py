@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from src.services.profile_service import ProfileService
 from src.services.recommendation_service import RecommendationService
+from src.services.program_index import program_index
 from bson import ObjectId
 import logging
 
@@ -11,13 +12,23 @@ profile_service = ProfileService()
 recommendation_service = RecommendationService()
 
 @router.get("/recommendations/{user_id}")
-async def get_recommendations(user_id: str):
-    profile = await profile_service.get_profile(ObjectId(user_id))
+async def get_recommendations(user_id: str, programs_per_course: int = Query(3, ge=0, le=20)):
+    profile = await profile_service.get_profile(ObjectId(user_id), include_chat_history=False)
     if not profile:
         logger.warning(f"Profile not found for user_id={user_id}")
         raise HTTPException(status_code=404, detail="Profile not found")
-    recs = await profile_service.get_courses_recommendation(ObjectId(user_id))
+    recs = profile.courses_recommendation or []
+    if not recs and profile.traits:
+        # Nothing generated yet: answer locally rather than leaving the page empty
+        recs = recommendation_service.recommend_locally(profile.dict())
     if not recs:
         logger.info(f"No recommendations available for user_id={user_id}")
         return {"recommendations": [], "message": "No recommendations available yet. Please check back later."}
+    if programs_per_course:
+        # Attach the best-ranked, cheapest programs for each course from the in-process index
+        await program_index.ensure_loaded()
+        recs = [
+            {**rec, "programs": program_index.top_programs(rec.get("course", ""), programs_per_course)}
+            for rec in recs
+        ]
     return {"recommendations": recs}
\ No newline at end of file
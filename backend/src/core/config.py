@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List
 
 class Settings(BaseSettings):
     MONGO_URI: str
@@ -7,6 +8,59 @@ class Settings(BaseSettings):
     PINECONE_INDEX_NAME: str
     JWT_SECRET_KEY: str
     GEMINI_API_KEY: str
+    # Register static prompt prefixes as Gemini cached content
+    GEMINI_CONTEXT_CACHE: bool = True
+    # Share evaluation results across processes through Mongo, on top of the in-process cache.
+    # Off by default: keys are per question/answer text, so cross-process hits are rare, and the
+    # extra Mongo read would sit on every chat turn's critical path
+    EVALUATION_CACHE_SHARED: bool = False
+    # Share recommendations for identical trait fingerprints across processes through Mongo.
+    # On by default: many users reach the same fingerprint, a hit saves a Gemini call of up to
+    # 20s, and refreshes run in the background, so the Mongo read costs no user-facing latency
+    RECOMMENDATION_CACHE_SHARED: bool = True
+    # Courses pre-ranked locally and offered to Gemini per recommendation (0 sends the whole catalog).
+    # Kept at 0 until scripts/benchmarks/recommendation_candidates.py has compared top-10 overlap
+    # against the full catalog with Gemini; 30 is the value it evaluates
+    RECOMMENDATION_CANDIDATES: int = 0
+    # Serve local recommendations when Gemini takes longer than this, errors or returns nothing
+    RECOMMENDATION_LATENCY_BUDGET_SECONDS: float = 20.0
+    # Store local recommendations right after the first trait merge, until Gemini's replace them
+    RECOMMENDATION_FAST_FIRST_ANSWER: bool = True
+    # Where recommendation refreshes run: "durable" enqueues them in Mongo for
+    # src/workers/recommendation_worker.py (deployed on a schedule by the deploy_worker CI job),
+    # "local" runs them in the API process, which only suits a long-running server, not Lambda
+    RECOMMENDATION_QUEUE: str = "durable"
+    # Background recommendation refreshes: global concurrency cap and per-user debounce
+    RECOMMENDATION_MAX_CONCURRENCY: int = 2
+    RECOMMENDATION_DEBOUNCE_SECONDS: float = 2.0
+    # Concurrent Gemini calls per priority class. Interactive calls have their own pool;
+    # evaluation and background calls share LLM_CONCURRENCY_SHARED slots, evaluation first
+    LLM_CONCURRENCY_INTERACTIVE: int = 32
+    LLM_CONCURRENCY_EVALUATION: int = 16
+    LLM_CONCURRENCY_BACKGROUND: int = 4
+    LLM_CONCURRENCY_SHARED: int = 16
+    # Background calls are shed once this many are queued or one has waited this long
+    LLM_BACKGROUND_MAX_QUEUE: int = 32
+    LLM_BACKGROUND_MAX_WAIT_SECONDS: float = 30.0
+    # Gemini models by tier, from most capable to fastest
+    LLM_TIERS: Dict[str, str] = {
+        "standard": "gemini-2.5-flash",
+        "fast": "gemini-2.5-flash-lite",
+    }
+    # Model tier and generation settings per task. A task whose p95 latency goes over
+    # latency_budget_seconds moves one tier faster for LLM_DOWNGRADE_SECONDS.
+    # thinking_budget None keeps the model's default thinking.
+    LLM_ROUTES: Dict[str, dict] = {
+        "conversation": {"tier": "standard", "thinking_budget": 0, "max_output_tokens": 1024, "latency_budget_seconds": 6.0},
+        "evaluation": {"tier": "standard", "thinking_budget": 0, "max_output_tokens": 512, "latency_budget_seconds": 4.0},
+        "recommendation": {"tier": "standard", "thinking_budget": None, "max_output_tokens": None, "latency_budget_seconds": 20.0},
+        "opener": {"tier": "standard", "thinking_budget": 0, "max_output_tokens": 1024},
+        "summarization": {"tier": "fast", "thinking_budget": 0, "max_output_tokens": 512, "latency_budget_seconds": 15.0},
+    }
+    LLM_DOWNGRADE_SECONDS: float = 600.0
+
+    # Signed-in users allowed to read GET /metrics; empty keeps it closed to everyone
+    METRICS_ADMIN_EMAILS: List[str] = []
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Callable, Dict, Optional
+import threading
+
+
+# Samples kept per histogram for percentile estimates
+HISTOGRAM_WINDOW = 512
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={labels[k]}" for k in sorted(labels)) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque = deque(maxlen=HISTOGRAM_WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Process-local counters and histograms, exposed as JSON on /metrics.
+    Names follow `<area>_<what>`; labels are passed as keyword arguments.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Callable[[], dict]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    def gauge(self, name: str, read: Callable[[], dict]) -> None:
+        """
+        Register a callable read on every snapshot, for current values such as queue depths.
+        """
+        self.gauges[name] = read
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self.histograms.get(_key(name, labels))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {k: h.summary() for k, h in self.histograms.items()},
+                "gauges": {k: read() for k, read in self.gauges.items()},
+            }
+
+
+metrics = Metrics()
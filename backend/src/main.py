@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exception_handlers import RequestValidationError
@@ -18,6 +18,8 @@ from .api.v1 import program
 from .api.v1 import orchestrator
 from .api.v1 import profile
 from .api.v1 import recommendation
+from .core.metrics import metrics
+from .core.config import settings
 from mangum import Mangum
 
 app = FastAPI(
@@ -63,6 +65,16 @@ async def health_check():
         "service": "StudyWat API"
     }
 
+async def require_metrics_admin(current_user=Depends(auth.get_current_user)):
+    if current_user.get("email") not in settings.METRICS_ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not allowed to read metrics")
+    return current_user
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_admin)])
+async def get_metrics():
+    # Process-local counters, latency/size histograms and queue gauges (see src/core/metrics.py)
+    return metrics.snapshot()
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     logger.error("Validation error:", exc)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, GetCoreSchemaHandler
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, field_validator
 from pydantic_core import core_schema
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -20,6 +20,15 @@ class PyObjectId(ObjectId):
             raise ValueError('Invalid ObjectId')
         return ObjectId(v)
 
+# Number of past evaluations kept per trait
+TRAIT_HISTORY_LIMIT = 5
+
+class TraitEvidence(BaseModel):
+    label: str
+    confidence: float
+    evidence: str
+    timestamp: datetime
+
 class Trait(BaseModel):
     trait: str  # The trait key, matching the manifest
     label: str
@@ -27,6 +36,33 @@ class Trait(BaseModel):
     confidence: float
     evidence: str
     timestamp: datetime
+    history: List[TraitEvidence] = []  # Most recent evaluations, oldest first
+
+def fold_trait(current: Optional[Trait], new: Trait, max_history: int = TRAIT_HISTORY_LIMIT) -> Trait:
+    """
+    Merge a new evaluation into the stored trait: the more confident label wins
+    (ties go to the newer one) and the evaluation is appended to the capped history.
+    Mirrors the server-side update in ProfileService.merge_trait.
+    """
+    entry = TraitEvidence(
+        label=new.label,
+        confidence=new.confidence,
+        evidence=new.evidence,
+        timestamp=new.timestamp
+    )
+    history = (current.history if current else []) + [entry]
+    best = new if current is None or new.confidence >= current.confidence else current
+    return best.model_copy(update={"history": history[-max_history:]})
+
+def compact_traits(traits: List[Any]) -> Dict[str, Trait]:
+    """
+    Fold a legacy append-only trait list into the keyed form.
+    """
+    compacted: Dict[str, Trait] = {}
+    for t in traits:
+        trait = t if isinstance(t, Trait) else Trait(**t)
+        compacted[trait.trait] = fold_trait(compacted.get(trait.trait), trait)
+    return compacted
 
 class AlertType(str, Enum):
     profile_update = "profile_update"
@@ -41,14 +77,32 @@ class ChatMessage(BaseModel):
     content: str
     timestamp: datetime
     alert: List[Alert] = []
+    truncated: bool = False  # Assistant reply cut short because the client disconnected mid-stream
+
+class ConversationSummary(BaseModel):
+    text: str
+    message_count: int  # Stored messages, counted from the start of the chat, folded into the summary
+    updated_at: datetime
 
 class Profile(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     user_id: PyObjectId
-    traits: List[Trait] = []
+    traits: Dict[str, Trait] = {}  # Keyed by trait name
     updated_at: datetime
     chat_history: List[ChatMessage] = []
     courses_recommendation: Optional[list] = None
+    recommendation_fingerprint: Optional[str] = None  # Trait fingerprint courses_recommendation was generated for
+    conversation_summary: Optional[ConversationSummary] = None
+    # Number of stored chat messages, set when the profile is read for a turn without its chat history
+    chat_history_count: Optional[int] = Field(default=None, exclude=True)
+
+    @field_validator("traits", mode="before")
+    @classmethod
+    def compact_legacy_traits(cls, v):
+        # Profiles written before traits were keyed store an append-only list
+        if isinstance(v, list):
+            return compact_traits(v)
+        return v or {}
 
     class Config:
         validate_by_name = True
@@ -1,16 +1,57 @@
 from src.services.gemini_service import GeminiService
+from src.services.profile_service import ProfileService
+from src.services.opener_service import OpenerService
+from src.models.pydantic.profile import ConversationSummary
+from datetime import datetime
 import asyncio
 import json
 from pathlib import Path
+import logging
+logger = logging.getLogger(__name__)
+
+# Most recent messages sent verbatim; anything older is represented by the running summary
+CONVERSATION_WINDOW_MESSAGES = 12
+# Messages not yet folded into the summary are sent verbatim too, up to this many
+CONVERSATION_MAX_MESSAGES = 20
+# Older messages that must pile up before the summary is refreshed
+SUMMARY_BATCH_MESSAGES = 4
+# Upper bound on messages folded in one refresh, so catching up on a long chat stays incremental
+SUMMARY_MAX_MESSAGES = 100
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a study advisor and a student. "
+    "Fold the new messages into the existing summary. Keep what the student shared about their interests, "
+    "strengths, learning style, goals, constraints and preferences, and any question still left open. "
+    "Write in the third person, under 150 words. Output only the summary.\n"
+)
+
+# Asked without Gemini when it is unavailable, one per trait
+FALLBACK_QUESTIONS = {
+    "learning_style": "How do you usually learn something new best: by watching, listening, reading, or trying it yourself?",
+    "motivation": "What usually keeps you going with your studies: curiosity, grades, a future career, or something else?",
+    "goal": "Is there a job or field you can picture yourself working in one day?",
+    "academic_strengths": "Which subjects do you find come most naturally to you?",
+    "decision_driver": "When choosing a university, what matters most to you: cost, reputation, location, or campus life?",
+    "financial_need_level": "How big a part does the cost of studying play in your plans?",
+    "geographic_openness": "Would you prefer to study close to home, elsewhere in the country, or abroad?",
+    "personality_orientation": "Do you tend to recharge by spending time with people or by having some time to yourself?",
+    "brand_affinity": "Are there any universities you already admire or have your eye on?",
+}
+FALLBACK_CLOSING = "Thanks for sharing all of that! Take a look at your recommendations, and tell me if anything there surprises you."
 
 class ConversationService:
     def __init__(self):
         self.gemini = GeminiService()
+        self.profile_service = ProfileService()
+        self._summarizing = {}  # user id -> summary refresh in flight
         # Removed default_turns and get_next_turn, as only LLM streaming is used now
         self.trait_manifest = self.load_trait_manifest()
         self.probes_manifest = self.load_probes_manifest()
         self.enhancements_manifest = self.load_enhancements_manifest()
         self.confidence_threshold = 0.8
+        # Rendered once; every turn's prompt starts with this exact text so it can be cached
+        self.static_prefix = self.build_static_prefix()
+        self.openers = OpenerService(self)
 
     def load_trait_manifest(self):
         manifest_path = Path(__file__).parent.parent / "manifests" / "traits.json"
@@ -44,6 +85,88 @@ class ConversationService:
             lines.append(f"- {e['name']}: {e['instruction']}")
         return "\n".join(lines)
 
+    def build_static_prefix(self):
+        return (
+            f"{self.format_enhancements_for_prompt()}\n\n"
+            f"{self.format_probes_for_prompt()}\n\n"
+            "You are a study advisor. You will be given a task, the user's profile and the conversation so far.\n"
+            "Important: Only output the final message or question you would say to the user. Do not include your reasoning, trait selection, or probe selection in your response."
+        )
+
+    def format_profile_for_prompt(self, user_profile):
+        """
+        Compact profile for prompts: one line per trait with its current label and confidence.
+        Chat history, recommendations and evidence are left out; the conversation is sent separately.
+        """
+        if not user_profile.traits:
+            return "(nothing known yet)"
+        return "\n".join(
+            f"- {key}: {t.label} ({t.confidence:.2f})" for key, t in user_profile.traits.items()
+        )
+
+    @staticmethod
+    def format_conversation_for_prompt(conversation_history):
+        return "\n".join(
+            f"{m.get('role', 'user')}: {m.get('content', '')}" for m in (conversation_history or [])
+        )
+
+    def window_conversation(self, user_profile, conversation_history):
+        """
+        Split the conversation for the prompt: the running summary of older turns (if any)
+        and the most recent messages verbatim. The verbatim part reaches back to the first stored
+        message the summary doesn't cover yet (capped at CONVERSATION_MAX_MESSAGES), so messages
+        still waiting for the next refresh are not lost from the prompt.
+        """
+        history = conversation_history or []
+        summary = user_profile.conversation_summary
+        size = CONVERSATION_WINDOW_MESSAGES
+        if user_profile.chat_history_count is not None:
+            covered = summary.message_count if summary else 0
+            # +1 for this turn's user message, which may not be stored yet
+            uncovered = max(user_profile.chat_history_count - covered, 0) + 1
+            size = min(max(size, uncovered), CONVERSATION_MAX_MESSAGES)
+        recent = history[-size:]
+        return (summary.text if summary else None), recent
+
+    def maybe_refresh_summary(self, user_profile, conversation_history):
+        """
+        Once the conversation has outgrown the verbatim window, refresh the summary in the
+        background. The refresh itself decides whether enough new messages have piled up.
+        """
+        if len(conversation_history or []) <= CONVERSATION_WINDOW_MESSAGES:
+            return
+        user_id = user_profile.user_id
+        if user_id in self._summarizing:
+            return
+        task = asyncio.create_task(self.refresh_summary(user_id))
+        self._summarizing[user_id] = task
+        task.add_done_callback(lambda _: self._summarizing.pop(user_id, None))
+
+    async def refresh_summary(self, user_id):
+        """
+        Fold stored messages that have left the verbatim window into the profile's running summary.
+        Only the not-yet-summarized messages are read and sent, so each refresh costs the same.
+        """
+        try:
+            summary, total = await self.profile_service.get_summary_state(user_id)
+            covered = summary.message_count if summary else 0
+            target = total - CONVERSATION_WINDOW_MESSAGES
+            if target - covered < SUMMARY_BATCH_MESSAGES:
+                return
+            upto = min(target, covered + SUMMARY_MAX_MESSAGES)
+            messages, _ = await self.profile_service.get_chat_history_page(user_id, before=upto, limit=upto - covered)
+            new_messages = self.format_conversation_for_prompt([{"role": m.role, "content": m.content} for m in messages])
+            prompt = (
+                f"Existing summary:\n{summary.text if summary else '(none)'}\n\n"
+                f"New messages:\n{new_messages}\n"
+            )
+            response = await self.gemini.generate(prompt, static_prefix=SUMMARY_INSTRUCTIONS, task="summarization")
+            refreshed = ConversationSummary(text=response.text.strip(), message_count=upto, updated_at=datetime.utcnow())
+            if await self.profile_service.update_conversation_summary(user_id, refreshed, covered):
+                logger.info(f"Conversation summary for user_id={user_id} now covers {upto} messages")
+        except Exception as e:
+            logger.error(f"Failed to refresh conversation summary for user_id={user_id}: {e}")
+
     def get_required_traits(self):
         return [t["trait"] for t in self.trait_manifest]
 
@@ -52,7 +175,7 @@ class ConversationService:
         Returns one of: 'exploration', 'consolidation', 'recommendation'
         """
         required_traits = set(self.get_required_traits())
-        profile_traits = {t.trait: t for t in user_profile.traits}
+        profile_traits = user_profile.traits
         missing_traits = required_traits - set(profile_traits.keys())
         if missing_traits:
             return "exploration"
@@ -66,7 +189,7 @@ class ConversationService:
         if state == "recommendation":
             prompt = "Thank you for sharing! We now have enough information to make recommendations."
         elif state == "consolidation":
-            low_conf_traits = [t for t in user_profile.traits if t.confidence < self.confidence_threshold]
+            low_conf_traits = [t for t in user_profile.traits.values() if t.confidence < self.confidence_threshold]
             if low_conf_traits:
                 trait = low_conf_traits[0]
                 desc = next((d["description"] for d in self.trait_manifest if d["trait"] == trait.trait), trait.trait)
@@ -80,7 +203,7 @@ class ConversationService:
                 prompt = "Ask a follow-up question to clarify the user's profile."
         elif state == "exploration":
             required_traits = self.get_required_traits()
-            profile_traits = {t.trait for t in user_profile.traits}
+            profile_traits = set(user_profile.traits)
             missing_traits = [t for t in required_traits if t not in profile_traits]
             if missing_traits:
                 # Prepare missing traits with descriptions
@@ -98,27 +221,67 @@ class ConversationService:
         else:
             prompt = "Ask a question to learn more about the user."
 
-        enhancements_section = self.format_enhancements_for_prompt()
-        probes_section = self.format_probes_for_prompt()
+        summary_text, recent = self.window_conversation(user_profile, conversation_history)
+        summary_section = f"Summary of the earlier conversation:\n{summary_text}\n" if summary_text else ""
+        # Only the per-turn part; the static prefix is sent ahead of it
         full_prompt = (
-            f"{enhancements_section}\n\n"
-            f"{probes_section}\n\n"
-            "You are a study advisor. Given the user's profile and the conversation so far, "
+            "Given the user's profile and the conversation so far, "
             f"here is your task: {prompt}\n"
-            f"Profile: {user_profile.dict()}\n"
-            f"Conversation: {conversation_history}\n"
+            f"Profile:\n{self.format_profile_for_prompt(user_profile)}\n"
+            f"{summary_section}"
+            f"Conversation:\n{self.format_conversation_for_prompt(recent)}\n"
             "Next turn: \n"
-            "Important: Only output the final message or question you would say to the user. Do not include your reasoning, trait selection, or probe selection in your response."
         )
         return full_prompt
 
+    def fallback_turn(self, user_profile) -> str:
+        """
+        A canned next question, used when Gemini can't be reached: the first missing trait,
+        else the least confident one, else a closing line.
+        """
+        missing = [t for t in self.get_required_traits() if t not in user_profile.traits]
+        if missing:
+            return FALLBACK_QUESTIONS.get(missing[0], FALLBACK_CLOSING)
+        low_conf = sorted(
+            (t for t in user_profile.traits.values() if t.confidence < self.confidence_threshold),
+            key=lambda t: t.confidence
+        )
+        if low_conf:
+            return FALLBACK_QUESTIONS.get(low_conf[0].trait, FALLBACK_CLOSING)
+        return FALLBACK_CLOSING
+
+    async def pooled_opener(self, user_profile, conversation_history):
+        """
+        A pre-generated first reply for a brand-new conversation, if this turn qualifies.
+        """
+        if not OpenerService.eligible(user_profile, conversation_history):
+            return None
+        return await self.openers.pick(user_profile.user_id)
+
     async def next_turn(self, user_profile, conversation_history):
+        opener = await self.pooled_opener(user_profile, conversation_history)
+        if opener:
+            return opener
         full_prompt = self._build_prompt(user_profile, conversation_history)
-        return await self.gemini.generate_response([
-            {"role": "system", "content": full_prompt}
-        ])
+        self.maybe_refresh_summary(user_profile, conversation_history)
+        try:
+            response = await self.gemini.generate(full_prompt, static_prefix=self.static_prefix, task="conversation")
+            return response.text
+        except Exception as e:
+            logger.error(f"Error generating Gemini response: {e}")
+            return self.fallback_turn(user_profile)
 
-    async def stream_next_turn(self, user_profile, conversation_history):
+    async def stream_next_turn(self, user_profile, conversation_history, cancel_event=None):
+        opener = await self.pooled_opener(user_profile, conversation_history)
+        if opener:
+            yield opener
+            return
         full_prompt = self._build_prompt(user_profile, conversation_history)
-        async for chunk in self.gemini.stream_response([full_prompt]):
+        self.maybe_refresh_summary(user_profile, conversation_history)
+        async for chunk in self.gemini.stream_response(
+            [full_prompt],
+            cancel_event=cancel_event,
+            static_prefix=self.static_prefix,
+            fallback=self.fallback_turn(user_profile)
+        ):
             yield chunk
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+In-process TF-IDF index over the fields of study in resources/field_of_study.txt.
+Built once when RecommendationService starts; scores courses against a user's trait labels
+and evidence without calling Gemini, so only the best candidates are sent for final ranking.
+"""
+from collections import Counter
+from typing import Dict, List, Tuple
+import math
+import re
+
+TOKEN_RE = re.compile(r"[a-z][a-z\-]+")
+
+STOPWORDS = frozenset("""
+a about above after again all also an and any are as at be because been being both but by can
+could did do does doing during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just like me more most my no nor not now of off on
+once only or other our out over own same she should so some such than that the their them then
+there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours student students user really want wants
+include includes including involves well different field study course courses
+""".split())
+
+# How much each trait's text counts towards the course query. Traits about what the student
+# enjoys or wants to become say much more about the course than ones about cost or location.
+TRAIT_WEIGHTS = {
+    "goal": 3.0,
+    "academic_strengths": 3.0,
+    "motivation": 1.0,
+    "learning_style": 1.0,
+    "personality_orientation": 1.0,
+}
+DEFAULT_TRAIT_WEIGHT = 0.5
+
+# Words students use for careers and interests, mapped to the words the catalog uses for the
+# matching courses, so "doctor" or "hospital" reach Medicine and Nursing. Expanded terms count
+# for EXPANSION_WEIGHT of the original.
+TERM_EXPANSIONS = {
+    "doctor": "medicine medical health clinical",
+    "physician": "medicine medical health clinical",
+    "surgeon": "medicine medical health clinical",
+    "hospital": "medical health healthcare clinical nursing",
+    "sick": "medical health healthcare nursing",
+    "patient": "medical health healthcare nursing",
+    "nurse": "nursing healthcare health",
+    "dentist": "dentistry",
+    "pharmacist": "pharmacy pharmaceutical",
+    "vet": "veterinary animal",
+    "veterinarian": "veterinary animal",
+    "software": "computer software programming information",
+    "developer": "computer software programming information",
+    "programmer": "computer software programming information",
+    "app": "computer software programming information",
+    "apps": "computer software programming information",
+    "coding": "computer programming software information",
+    "engineer": "engineering",
+    "robot": "mechatronic engineering mechanical",
+    "machine": "mechanical engineering",
+    "writer": "journalism writing communication media",
+    "writing": "journalism communication media",
+    "story": "journalism writing media",
+    "stories": "journalism writing media",
+    "article": "journalism writing media",
+    "magazine": "journalism media",
+    "lawyer": "law legal",
+    "teacher": "teaching education",
+    "teach": "teaching education",
+    "drawing": "art design",
+    "artist": "art design",
+    "company": "business management entrepreneurship",
+    "startup": "business entrepreneurship",
+    "accountant": "accounting",
+    "chef": "culinary",
+    "cooking": "culinary food",
+    "psychologist": "psychology",
+    "architect": "architecture",
+}
+EXPANSION_WEIGHT = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        token = token.strip("-")
+        # Crude plural folding so "maths"/"math" and "designs"/"design" match
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if len(token) > 2 and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def _expansions() -> Dict[str, List[str]]:
+    # Keys and values go through tokenize so they match its plural folding
+    expansions: Dict[str, List[str]] = {}
+    for word, related in TERM_EXPANSIONS.items():
+        for key in tokenize(word):
+            expansions.setdefault(key, []).extend(tokenize(related))
+    return expansions
+
+
+EXPANSIONS = _expansions()
+
+
+def trait_query(traits: List[dict]) -> Dict[str, float]:
+    """
+    Weighted term counts for a user's traits: label, label description and evidence,
+    plus the catalog terms each word expands to.
+    """
+    terms: Dict[str, float] = {}
+    for t in traits:
+        weight = TRAIT_WEIGHTS.get(t.get("trait"), DEFAULT_TRAIT_WEIGHT) * (t.get("confidence") or 0.5)
+        text = " ".join(str(t.get(k) or "") for k in ("label", "label_description", "evidence"))
+        for token, n in Counter(tokenize(text)).items():
+            terms[token] = terms.get(token, 0.0) + weight * n
+            for related in EXPANSIONS.get(token, []):
+                terms[related] = terms.get(related, 0.0) + EXPANSION_WEIGHT * weight * n
+    return terms
+
+
+class CourseIndex:
+    def __init__(self, courses: List[dict]):
+        """
+        courses: dicts with field, course and description, as loaded by RecommendationService.
+        """
+        self.courses = courses
+        docs = []
+        for c in courses:
+            # The course and field names are the strongest signal, so they are repeated
+            name = f"{c['course']} {c['field']} "
+            docs.append(Counter(tokenize(name * 3 + c["description"])))
+        df = Counter(term for doc in docs for term in doc)
+        n = len(docs)
+        self.idf = {term: math.log((1 + n) / (1 + count)) + 1.0 for term, count in df.items()}
+        self.vectors = [self._normalize({t: (1 + math.log(c)) * self.idf[t] for t, c in doc.items()}) for doc in docs]
+
+    @staticmethod
+    def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if not norm:
+            return vector
+        return {t: v / norm for t, v in vector.items()}
+
+    def query_vector(self, terms: Dict[str, float]) -> Dict[str, float]:
+        return self._normalize({t: (1 + math.log(1 + w)) * self.idf[t] for t, w in terms.items() if t in self.idf})
+
+    def score(self, traits: List[dict]) -> List[Tuple[float, int]]:
+        """
+        Cosine similarity of every course against the traits, best first.
+        Ties keep catalog order so results are deterministic.
+        """
+        query = self.query_vector(trait_query(traits))
+        scores = [
+            (sum(w * vector.get(t, 0.0) for t, w in query.items()), i)
+            for i, vector in enumerate(self.vectors)
+        ]
+        return sorted(scores, key=lambda s: (-s[0], s[1]))
+
+    def label_overlap(self, trait: dict, course: int) -> List[str]:
+        """
+        Terms of a trait's label (and the catalog terms they expand to) that the course's text contains.
+        Used to explain a match, so a course is only said to match a label it shares words with.
+        """
+        vector = self.vectors[course]
+        terms = []
+        for token in tokenize(str(trait.get("label") or "")):
+            for term in [token] + EXPANSIONS.get(token, []):
+                if term in vector and term not in terms:
+                    terms.append(term)
+        return terms
+
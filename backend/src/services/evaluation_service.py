@@ -1,12 +1,28 @@
 from datetime import datetime
 from src.services.gemini_service import GeminiService
+from src.services.response_cache import ResponseCache
+from src.services.llm_resilience import LLMUnavailable
+from src.services.trait_gate import TraitGate
+from src.core.metrics import metrics
+from src.core.config import settings
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import json
+import asyncio
+import hashlib
 from pathlib import Path
 import logging
 logger = logging.getLogger(__name__)
 
+# Upper bound on a single evaluation call; the turn continues without a trait update past this
+EVALUATION_TIMEOUT_SECONDS = 20
+EVALUATION_CACHE_TTL_SECONDS = 24 * 3600
+EVALUATION_CACHE_SIZE = 4096
+
+def _normalize(text: str) -> str:
+    # Case, spacing and trailing punctuation don't change what an answer says about a trait
+    return " ".join(text.lower().split()).strip(" .!?~")
+
 class EvaluationResult(BaseModel):
     label: str
     confidence: float
@@ -17,6 +33,16 @@ class EvaluationService:
     def __init__(self):
         self.gemini = GeminiService()
         self.trait_manifest = self.load_trait_manifest()
+        # Rendered once; every evaluation prompt starts with this exact text so it can be cached
+        self.static_prefix = self.build_static_prefix()
+        self.gate = TraitGate(self.trait_manifest)
+        self.manifest_version = hashlib.sha256(self.static_prefix.encode("utf-8")).hexdigest()[:16]
+        self.cache = ResponseCache(
+            "evaluation",
+            EVALUATION_CACHE_TTL_SECONDS,
+            maxsize=EVALUATION_CACHE_SIZE,
+            shared=settings.EVALUATION_CACHE_SHARED
+        )
 
     def load_trait_manifest(self):
         manifest_path = Path(__file__).parent.parent / "manifests" / "traits.json"
@@ -31,17 +57,10 @@ class EvaluationService:
     def get_trait_keys(self):
         return [t["trait"] for t in self.trait_manifest]
 
-    async def evaluate_answer(self, turn: str, user_answer: str) -> dict:
-        """
-        Use Gemini to evaluate the user's answer to a turn and extract a trait, label, confidence, and evidence.
-        Gemini is instructed to select the most relevant trait from the manifest and use the description to guide evaluation.
-        """
-        from google import genai
-        manifest_text = self.manifest_traits_text()
-        trait_keys = self.get_trait_keys()
-        prompt = (
+    def build_static_prefix(self):
+        return (
             "You are an educational psychologist and career coach. Here are the traits we are interested in, with their descriptions:\n"
-            f"{manifest_text}\n"
+            f"{self.manifest_traits_text()}\n"
             "Given the following turn and user answer, select the most relevant trait (from the list above). "
             "For the selected trait, return a JSON object with these fields: "
             "trait (the trait key from the list), label (the specific characteristic, e.g., 'Visual Learner'), "
@@ -49,16 +68,53 @@ class EvaluationService:
             "confidence (float between 0 and 1), and evidence (short text snippet justifying the label). "
             "The label should be phrased and capitalized for display as a card title. "
             "If the user's answer does not provide any information about a trait, return an empty JSON object {}.\n"
+        )
+
+    def cache_key(self, turn: Optional[str], user_answer: str, traits: Optional[List[str]] = None) -> str:
+        """
+        Content address of an evaluation: the normalized turn and answer, the traits it was narrowed to,
+        and the manifest version, so editing the manifest or instructions invalidates every cached result.
+        """
+        return ResponseCache.make_key(
+            _normalize(turn or ""), _normalize(user_answer), ",".join(sorted(traits or [])), self.manifest_version
+        )
+
+    async def evaluate_answer(self, turn: str, user_answer: str) -> dict:
+        """
+        Use Gemini to evaluate the user's answer to a turn and extract a trait, label, confidence, and evidence.
+        Gemini is instructed to select the most relevant trait from the manifest and use the description to guide evaluation.
+        A local gate skips messages that can't carry trait information and narrows the traits Gemini considers.
+        Results, including "no trait", are cached by content so repeated turn/answer pairs skip the LLM.
+        """
+        decision = self.gate.classify(turn, user_answer)
+        if not decision.informative:
+            metrics.incr("evaluation_llm_calls_avoided", reason=decision.reason)
+            return {}
+        key = self.cache_key(turn, user_answer, decision.traits)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            metrics.incr("evaluation_llm_calls_avoided", reason="cache")
+            return {**cached, "timestamp": datetime.utcnow()} if cached else {}
+
+        trait_keys = self.get_trait_keys()
+        prompt = (
             f"Turn: {turn}\n"
             f"Answer: {user_answer}"
         )
+        if decision.traits:
+            prompt += f"\nOnly consider these traits: {', '.join(decision.traits)}"
+        metrics.incr("evaluation_llm_calls")
         try:
-            response = self.gemini.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json",
-                },
+            response = await asyncio.wait_for(
+                self.gemini.generate(
+                    prompt,
+                    static_prefix=self.static_prefix,
+                    task="evaluation",
+                    config={
+                        "response_mime_type": "application/json",
+                    },
+                ),
+                timeout=EVALUATION_TIMEOUT_SECONDS
             )
             logger.debug("LLM RAW RESPONSE: %s", response.text)
             logger.debug("LLM PARSED RESPONSE: %s", response.parsed)
@@ -83,12 +139,19 @@ class EvaluationService:
                     "label": label,
                     "label_description": label_description,
                     "confidence": confidence,
-                    "evidence": evidence,
-                    "timestamp": datetime.utcnow()
+                    "evidence": evidence
                 }
-                return result
+                await self.cache.set(key, result)
+                return {**result, "timestamp": datetime.utcnow()}
             else:
+                await self.cache.set(key, {})
                 return {}
+        except asyncio.TimeoutError:
+            logger.warning("EvaluationService timed out after %ss", EVALUATION_TIMEOUT_SECONDS)
+            return {}
+        except LLMUnavailable:
+            # Circuit open: skip evaluation for this turn rather than wait on Gemini
+            return {}
         except Exception as e:
             logger.error("EvaluationService error: %s", e)
             return {
@@ -98,4 +161,4 @@ class EvaluationService:
                 "confidence": 0.0,
                 "evidence": "Could not parse LLM response.",
                 "timestamp": datetime.utcnow()
-            }
\ No newline at end of file
+            }
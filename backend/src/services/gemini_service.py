@@ -1,88 +1,311 @@
 import os
+import hashlib
+import time
 from google import genai
-from typing import List
+from google.genai import types
+from typing import List, Optional, Tuple, Dict, Any
 from ..core.config import settings
+from ..core.metrics import metrics
+from .llm_scheduler import llm_scheduler
+from .llm_resilience import CircuitBreaker, LLMUnavailable, call_with_retries
+from .llm_router import llm_router
 import asyncio
-import threading
-import queue
 import logging
 logger = logging.getLogger(__name__)
 
+# Model and generation settings per task come from llm_router (settings.LLM_ROUTES)
+# Lifetime of a registered prompt prefix; it is re-registered shortly before expiry
+PREFIX_CACHE_TTL_SECONDS = 3600
+PREFIX_CACHE_REFRESH_MARGIN_SECONDS = 300
+# How long to wait before retrying a prefix Gemini refused to cache
+PREFIX_CACHE_RETRY_SECONDS = 3600
+# Gemini only caches content of at least this many tokens; smaller prefixes aren't even tried.
+# Estimated at PREFIX_CHARS_PER_TOKEN characters per token, on the low side for English text
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CHARS_PER_TOKEN = 4
+# Scheduler priority class of each task; unknown tasks run as background work
+TASK_PRIORITIES = {
+    "conversation": "interactive",
+    "evaluation": "evaluation",
+    "recommendation": "background",
+    "summarization": "background",
+}
+
+# Hedge the first chunk of a stream after the p95 first-chunk latency, once enough samples exist
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_SECONDS = 3.0
+HEDGE_MIN_DELAY_SECONDS = 0.5
+# A stream that produces nothing for this long after its first chunk is abandoned
+STREAM_CHUNK_TIMEOUT_SECONDS = 30.0
+
+
+async def _close_stream(response) -> None:
+    if response is not None and hasattr(response, "aclose"):
+        try:
+            await response.aclose()
+        except Exception:
+            pass
+
 
 class GeminiService:
+    # Registered prompt prefixes, shared by every service's GeminiService in the process.
+    # Maps sha256(model + prefix) -> {"name": cached content name or None, "expires_at": monotonic time}
+    _prefix_caches: Dict[str, dict] = {}
+    # One lock per prefix, so registering one prefix doesn't hold up calls using another
+    _prefix_locks: Dict[str, asyncio.Lock] = {}
+    # One circuit breaker per model, shared by the process
+    _breakers: Dict[str, CircuitBreaker] = {}
+
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
-        
+
         self.client = genai.Client(api_key=self.api_key)
 
-    async def generate_response(self, conversation_history: List[dict]) -> str:
+    @classmethod
+    def breaker(cls, model: str) -> CircuitBreaker:
+        if model not in cls._breakers:
+            cls._breakers[model] = CircuitBreaker(model)
+            metrics.gauge("llm_circuit", lambda: {name: b.state for name, b in cls._breakers.items()})
+        return cls._breakers[model]
+
+    async def _cached_prefix_name(self, prefix: str, model: str) -> Optional[str]:
+        """
+        Return the name of a Gemini cached content holding `prefix`, registering it on first use.
+        Returns None when context caching is disabled, the prefix is below Gemini's minimum cacheable size
+        or Gemini will not cache it, in which case the prefix is sent inline (and can still hit Gemini's implicit prefix cache).
+        """
+        if not settings.GEMINI_CONTEXT_CACHE:
+            return None
+        if len(prefix) < PREFIX_CACHE_MIN_TOKENS * PREFIX_CHARS_PER_TOKEN:
+            # Too small for an explicit cache; Gemini's implicit prefix cache still applies
+            return None
+        key = hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+        entry = self._prefix_caches.get(key)
+        if entry and entry["expires_at"] > time.monotonic():
+            return entry["name"]
+        lock = self._prefix_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._prefix_caches.get(key)
+            if entry and entry["expires_at"] > time.monotonic():
+                return entry["name"]
+            try:
+                cache = await self.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[prefix],
+                        display_name=f"studywat-prefix-{key[:12]}",
+                        ttl=f"{PREFIX_CACHE_TTL_SECONDS}s",
+                    ),
+                )
+                entry = {
+                    "name": cache.name,
+                    "expires_at": time.monotonic() + PREFIX_CACHE_TTL_SECONDS - PREFIX_CACHE_REFRESH_MARGIN_SECONDS,
+                }
+                logger.info(f"Registered cached prompt prefix {cache.name} ({len(prefix)} chars)")
+            except Exception as e:
+                logger.info(f"Prompt prefix not cached, sending inline: {e}")
+                entry = {"name": None, "expires_at": time.monotonic() + PREFIX_CACHE_RETRY_SECONDS}
+            self._prefix_caches[key] = entry
+            return entry["name"]
+
+    async def _prepare(
+        self,
+        task: str,
+        model: str,
+        prompt: str,
+        static_prefix: Optional[str],
+        config: Optional[Dict[str, Any]]
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Build the request contents: the static prefix first (or a reference to its cached content),
+        then the per-call suffix. Records the prompt bytes actually sent for the task.
+        """
+        config = dict(config or {})
+        contents = [prompt]
+        if static_prefix:
+            cache_name = await self._cached_prefix_name(static_prefix, model)
+            if cache_name:
+                config["cached_content"] = cache_name
+                metrics.incr("llm_prompt_cached_bytes", len(static_prefix.encode("utf-8")), task=task)
+            else:
+                contents = [static_prefix, prompt]
+        metrics.observe("llm_prompt_bytes", sum(len(c.encode("utf-8")) for c in contents), task=task)
+        return contents, config
+
+    async def generate(
+        self,
+        prompt: str,
+        static_prefix: Optional[str] = None,
+        task: str = "default",
+        config: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        priority: Optional[str] = None
+    ):
         """
-        Generate a response from Gemini based on conversation history.
-        
+        Generate a response with the async client.
         Args:
-            conversation_history: List of messages with 'role' and 'content'
-            
+            prompt: The per-call part of the prompt
+            static_prefix: Instructions shared by every call of this task, placed first so it can be cached
+            task: Name used for metrics, and to pick the model route and scheduler priority class
+            config: Generation config, on top of the task's routed settings
+            model: Overrides the task's routed model
+            priority: Overrides the task's priority class
+        Transient failures are retried with jittered backoff within the task's deadline.
         Returns:
-            Generated response from Gemini
+            The SDK response
+        Raises:
+            LLMOverloaded: background work was shed by the scheduler
+            LLMUnavailable: the circuit breaker is open
         """
-        try:
-            # Build the conversation context with a system prompt
-            system_prompt = """You are a helpful study advisor."""
-            
-            conversation_text = f"System: {system_prompt}\n\n"
-            for message in conversation_history:
-                role = message["role"]
-                content = message["content"]
-                conversation_text += f"{role}: {content}\n"
-            
-            # Generate response using the simple approach
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=conversation_text
+        routed_model, routed_config = llm_router.route(task)
+        model = model or routed_model
+        contents, config = await self._prepare(task, model, prompt, static_prefix, {**routed_config, **(config or {})})
+        priority = priority or TASK_PRIORITIES.get(task, "background")
+
+        async def attempt():
+            # The slot is taken per attempt so backoff sleeps don't hold it
+            async with llm_scheduler.slot(priority):
+                started = time.perf_counter()
+                response = await self.client.aio.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config or None
                 )
-            )
-            
-            return response.text
-            
-        except Exception as e:
-            logger.error(f"Error generating Gemini response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again in a moment." 
+                llm_router.record(task, model, time.perf_counter() - started, getattr(response, "usage_metadata", None))
+                return response
+        return await call_with_retries(attempt, task, self.breaker(model))
+
+    @staticmethod
+    def hedge_delay(task: str) -> float:
+        """
+        How long to wait for a stream's first chunk before sending a second, identical request.
+        """
+        histogram = metrics.histogram("llm_first_chunk_seconds", task=task)
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        return max(HEDGE_MIN_DELAY_SECONDS, histogram.percentile(0.95))
+
+    async def _open_stream(self, model: str, contents: List[str], config: Dict[str, Any]):
+        """
+        Start a stream and wait for its first chunk. Returns (response, first chunk or None).
+        """
+        response = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config or None
+        )
+        try:
+            return response, await response.__anext__()
+        except StopAsyncIteration:
+            return response, None
+        except BaseException:
+            await _close_stream(response)
+            raise
 
-    async def stream_response(self, contents: list[str]):
+    async def _open_stream_hedged(self, task: str, model: str, contents: List[str], config: Dict[str, Any]):
         """
-        Stream a response from Gemini using the official streaming API.
+        Open a stream, and if its first chunk is slower than the task's p95, race a second
+        request against it. The first to produce a chunk wins; the other is cancelled and closed.
+        """
+        started = time.perf_counter()
+        primary = asyncio.create_task(self._open_stream(model, contents, config))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(task))
+        tasks = {primary}
+        if not done:
+            metrics.incr("llm_hedges", task=task)
+            tasks.add(asyncio.create_task(self._open_stream(model, contents, config)))
+        winner = None
+        try:
+            pending = set(tasks)
+            error = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        winner = winner or t
+                    else:
+                        error = error or t.exception()
+            if winner is None:
+                raise error
+            if winner is not primary:
+                metrics.incr("llm_hedge_wins", task=task)
+            first_chunk_seconds = time.perf_counter() - started
+            metrics.observe("llm_first_chunk_seconds", first_chunk_seconds, task=task)
+            llm_router.record(task, model, first_chunk_seconds)
+            return winner.result()
+        finally:
+            for t in tasks - {winner}:
+                if not t.done():
+                    t.cancel()
+                    continue
+                # A loser that also opened a stream must still be closed
+                if not t.cancelled() and t.exception() is None:
+                    await _close_stream(t.result()[0])
+
+    async def stream_response(
+        self,
+        contents: list[str],
+        cancel_event: Optional[asyncio.Event] = None,
+        static_prefix: Optional[str] = None,
+        task: str = "conversation",
+        fallback: Optional[str] = None
+    ):
+        """
+        Stream a response from Gemini using the SDK's native async streaming API.
+        Opening the stream is retried and hedged (see _open_stream_hedged) within the task's deadline;
+        once the first chunk has been yielded there are no retries.
         Args:
             contents: List of strings (conversation turns or prompts)
+            cancel_event: Optional event set when the consumer has gone away; the upstream
+                stream is closed as soon as it is seen so no further tokens are generated or billed
+            static_prefix: Instructions shared by every call of this task, placed first so it can be cached
+            fallback: Text to yield instead of an error message if the stream can't be started
         Yields:
             Each chunk's text as it arrives
         """
-        q = queue.Queue()
-
-        def run_stream():
-            try:
-                response = self.client.models.generate_content_stream(
-                    model="gemini-2.5-flash",
-                    contents=contents
-                )
-                for chunk in response:
-                    logger.debug(f"[GEMINI CHUNK] {repr(chunk.text)}")
-                    q.put(chunk.text)
-            except Exception as e:
-                logger.error(f"Error streaming Gemini response: {e}")
-                q.put("[Error: Unable to stream response]")
-            finally:
-                q.put(None)  # Sentinel
-
-        threading.Thread(target=run_stream, daemon=True).start()
-
-        loop = asyncio.get_event_loop()
-        while True:
-            text = await loop.run_in_executor(None, q.get)
-            if text is None:
-                break
-            yield text 
\ No newline at end of file
+        response = None
+        priority = TASK_PRIORITIES.get(task, "background")
+        acquired = False
+        yielded = False
+        model, config = llm_router.route(task)
+        usage = None
+        try:
+            request_contents, config = await self._prepare(task, model, "\n".join(contents), static_prefix, config)
+            # The slot is held for the whole stream; a hedge request shares it
+            await llm_scheduler.acquire(priority)
+            acquired = True
+            response, chunk = await call_with_retries(
+                lambda: self._open_stream_hedged(task, model, request_contents, config),
+                task,
+                self.breaker(model)
+            )
+            while chunk is not None:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("Consumer disconnected, stopping Gemini stream")
+                    break
+                logger.debug(f"[GEMINI CHUNK] {repr(chunk.text)}")
+                # Usage is cumulative; the last chunk carries the totals
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.text:
+                    yielded = True
+                    yield chunk.text
+                try:
+                    chunk = await asyncio.wait_for(response.__anext__(), STREAM_CHUNK_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    chunk = None
+        except Exception as e:
+            logger.error(f"Error streaming Gemini response: {e}")
+            if fallback and not yielded:
+                metrics.incr("llm_fallbacks", task=task, reason="unavailable" if isinstance(e, LLMUnavailable) else "error")
+                yield fallback
+            else:
+                yield "[Error: Unable to stream response]"
+        finally:
+            if usage is not None:
+                llm_router.record_usage(task, usage)
+            # Closing the SDK iterator closes the underlying HTTP stream
+            await _close_stream(response)
+            if acquired:
+                llm_scheduler.release(priority)
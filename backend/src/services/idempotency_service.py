@@ -0,0 +1,120 @@
+"""
+Short-lived store of chat turn results keyed by a client-supplied Idempotency-Key.
+A record follows one user message through its stages: the user message saved and evaluated
+(`alert`), then the assistant reply (`assistant_text`). A repeated call with the same key skips
+the stages already done and returns, or re-streams, what was stored, so retries and an
+/alert-info + /stream-turn pair never save the message twice or repeat Gemini calls.
+
+Only one request may work on a key at a time: it holds the record (`in_progress`) under a lease,
+and a concurrent request with the same key waits for it. Records expire through a TTL index.
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+from src.clients.mongo_client import get_database
+from src.core.cache import TTLCache
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = 600
+# A request holding a key longer than this (e.g. its process died) loses it
+IDEMPOTENCY_LEASE_SECONDS = 120
+# How long a request waits for another one working on the same key
+IDEMPOTENCY_WAIT_SECONDS = 30
+IDEMPOTENCY_POLL_SECONDS = 0.25
+IDEMPOTENCY_CACHE_SIZE = 2048
+
+
+class IdempotencyConflict(Exception):
+    """Another request is still working on this key."""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was already used for a different message."""
+
+
+class IdempotencyService:
+    def __init__(self):
+        self.collection = get_database()["idempotency_keys"]
+        # Completed records only, so replays don't need a round trip
+        self.completed = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+        self._index_ready = False
+
+    @staticmethod
+    def record_id(user_id: ObjectId, key: str) -> str:
+        return f"{user_id}:{key}"
+
+    async def begin(self, user_id: ObjectId, key: str, message: str) -> dict:
+        """
+        Take the record for (user, key), creating it on first use. The returned record says which
+        stages are already done; pass it to save() and finally release().
+        Raises IdempotencyConflict if another request keeps the key for IDEMPOTENCY_WAIT_SECONDS,
+        IdempotencyMismatch if the key was used for another message.
+        """
+        rid = self.record_id(user_id, key)
+        record = self.completed.get(rid)
+        if record is not None:
+            self._check_message(record, message)
+            metrics.incr("idempotency_replays", tier="memory")
+            return {**record, "held": False}
+
+        if not self._index_ready:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._index_ready = True
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            now = datetime.utcnow()
+            try:
+                record = await self.collection.find_one_and_update(
+                    {"_id": rid, "$or": [{"in_progress": False}, {"lease_until": {"$lt": now}}]},
+                    {
+                        "$set": {"in_progress": True, "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)},
+                        "$setOnInsert": {"message": message, "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)},
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                record["held"] = True
+                try:
+                    self._check_message(record, message)
+                except IdempotencyMismatch:
+                    await self.release(record)
+                    raise
+                if record.get("alert") is not None:
+                    metrics.incr("idempotency_replays", tier="mongo")
+                return record
+            except DuplicateKeyError:
+                # Held by another request: wait for it to finish its stage
+                if asyncio.get_running_loop().time() >= deadline:
+                    raise IdempotencyConflict(f"Idempotency key {key} is still in progress")
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    @staticmethod
+    def _check_message(record: dict, message: str) -> None:
+        if record.get("message") != message:
+            raise IdempotencyMismatch("Idempotency key was already used for a different message")
+
+    async def save(self, record: dict, **fields) -> None:
+        """
+        Store the result of a completed stage (alert, assistant_text).
+        """
+        record.update(fields)
+        try:
+            await self.collection.update_one({"_id": record["_id"]}, {"$set": fields})
+        except Exception as e:
+            logger.warning(f"Failed to store idempotent result for {record['_id']}: {e}")
+        if record.get("assistant_text") is not None:
+            self.completed.set(record["_id"], {k: v for k, v in record.items() if k not in ("held", "in_progress", "lease_until")})
+
+    async def release(self, record: dict) -> None:
+        if not record.get("held"):
+            return
+        record["held"] = False
+        try:
+            await self.collection.update_one({"_id": record["_id"]}, {"$set": {"in_progress": False}})
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency key {record['_id']}: {e}")
@@ -0,0 +1,143 @@
+"""
+Resilience helpers for Gemini calls: per-task deadlines, bounded retries with exponential
+backoff and full jitter, and a circuit breaker that fails fast (LLMUnavailable) while the
+upstream is unhealthy so callers can switch to their local fallback straight away.
+"""
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import random
+import time
+import httpx
+from google.genai import errors
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Overall deadline per task, covering every attempt; unknown tasks get DEFAULT_DEADLINE_SECONDS
+TASK_DEADLINES = {
+    "conversation": 30.0,
+    "evaluation": 20.0,
+    "recommendation": 60.0,
+    "summarization": 60.0,
+}
+DEFAULT_DEADLINE_SECONDS = 30.0
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 4.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
+
+
+class LLMUnavailable(Exception):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+
+def is_transient(e: Exception) -> bool:
+    """
+    Whether a failure is worth retrying and counts against upstream health:
+    timeouts, transport errors, 5xx responses, and 408/429.
+    """
+    if isinstance(e, (asyncio.TimeoutError, httpx.TransportError, errors.ServerError)):
+        return True
+    return isinstance(e, errors.ClientError) and e.code in (408, 429)
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter: uniform over [0, base * 2^attempt], capped
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive transient failures. While open, calls are
+    rejected; after CIRCUIT_RESET_SECONDS one probe call is let through (half-open), and its
+    outcome closes the circuit again or re-opens it.
+    """
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.state == "closed":
+                logger.warning(f"Circuit {self.name} opened after {self.failures} consecutive failures")
+                metrics.incr("llm_circuit_opened", circuit=self.name)
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        # A probe that ended with a non-transient error says nothing about upstream health
+        self._probing = False
+
+
+async def call_with_retries(
+    call: Callable[[], Awaitable[T]],
+    task: str,
+    breaker: CircuitBreaker,
+    deadline: Optional[float] = None
+) -> T:
+    """
+    Run `call` until it succeeds, retrying transient failures with jittered backoff
+    within the task's deadline. Raises LLMUnavailable when the breaker rejects the call.
+    """
+    deadline = deadline or TASK_DEADLINES.get(task, DEFAULT_DEADLINE_SECONDS)
+    deadline_at = time.monotonic() + deadline
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        if not breaker.allow():
+            metrics.incr("llm_circuit_rejected", task=task)
+            raise LLMUnavailable(f"Gemini circuit {breaker.name} is open")
+        remaining = deadline_at - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            result = await asyncio.wait_for(call(), remaining)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                breaker.release_probe()
+                raise
+            breaker.record_failure()
+            delay = backoff_delay(attempt)
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or time.monotonic() + delay >= deadline_at:
+                metrics.incr("llm_failures", task=task)
+                raise
+            metrics.incr("llm_retries", task=task)
+            logger.info(f"Retrying {task} Gemini call in {delay:.2f}s after {type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
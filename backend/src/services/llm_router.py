@@ -0,0 +1,100 @@
+"""
+Per-task model routing for Gemini calls.
+settings.LLM_ROUTES maps each task to a model tier and its generation settings, and
+settings.LLM_TIERS lists tiers from most capable to fastest. When a task's observed p95
+latency on its model goes over the task's latency budget, the task is moved one tier faster
+for LLM_DOWNGRADE_SECONDS and then given its configured tier back.
+Latency is total call time, or time to first chunk for streams.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import logging
+import time
+from src.core.config import settings
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Samples needed on a model before its p95 is trusted for a downgrade decision
+ROUTER_MIN_SAMPLES = 20
+ROUTER_WINDOW = 50
+DEFAULT_ROUTE = {"tier": "standard"}
+
+
+class LLMRouter:
+    def __init__(self, routes: Dict[str, dict], tiers: Dict[str, str], downgrade_seconds: float):
+        self.routes = routes
+        self.tiers = tiers
+        self.tier_order = list(tiers)
+        self.downgrade_seconds = downgrade_seconds
+        # task -> (tier, monotonic time the downgrade ends)
+        self.downgrades: Dict[str, Tuple[str, float]] = {}
+        # task -> recent latencies on the task's current tier
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def tier(self, task: str) -> str:
+        configured = self.routes.get(task, DEFAULT_ROUTE)["tier"]
+        downgrade = self.downgrades.get(task)
+        if downgrade:
+            if downgrade[1] > time.monotonic():
+                return downgrade[0]
+            logger.info(f"Restoring {task} to the {configured} tier")
+            del self.downgrades[task]
+            self.samples.pop(task, None)
+        return configured
+
+    def route(self, task: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Model and generation config for the next call of `task`.
+        """
+        route = self.routes.get(task, DEFAULT_ROUTE)
+        config: Dict[str, Any] = {}
+        if route.get("max_output_tokens"):
+            config["max_output_tokens"] = route["max_output_tokens"]
+        if route.get("thinking_budget") is not None:
+            config["thinking_config"] = {"thinking_budget": route["thinking_budget"]}
+        return self.tiers[self.tier(task)], config
+
+    def record(self, task: str, model: str, seconds: float, usage: Optional[Any] = None) -> None:
+        """
+        Record one call's latency and token usage, and downgrade the task if it is over budget.
+        """
+        metrics.observe("llm_latency_seconds", seconds, task=task, model=model)
+        if usage is not None:
+            self.record_usage(task, usage)
+
+        budget = self.routes.get(task, DEFAULT_ROUTE).get("latency_budget_seconds")
+        if not budget or model != self.tiers[self.tier(task)]:
+            return
+        window = self.samples.setdefault(task, deque(maxlen=ROUTER_WINDOW))
+        window.append(seconds)
+        if len(window) < ROUTER_MIN_SAMPLES:
+            return
+        p95 = sorted(window)[min(len(window) - 1, int(len(window) * 0.95))]
+        current = self.tier(task)
+        position = self.tier_order.index(current)
+        if p95 > budget and position + 1 < len(self.tier_order):
+            faster = self.tier_order[position + 1]
+            logger.warning(f"{task} p95 {p95:.2f}s is over its {budget}s budget on {model}, switching to the {faster} tier")
+            metrics.incr("llm_downgrades", task=task, tier=faster)
+            self.downgrades[task] = (faster, time.monotonic() + self.downgrade_seconds)
+            self.samples.pop(task, None)
+
+    @staticmethod
+    def record_usage(task: str, usage: Any) -> None:
+        for kind, field in (
+            ("prompt", "prompt_token_count"),
+            ("cached", "cached_content_token_count"),
+            ("output", "candidates_token_count"),
+            ("thinking", "thoughts_token_count"),
+        ):
+            count = getattr(usage, field, None)
+            if count:
+                metrics.incr("llm_tokens", count, task=task, kind=kind)
+
+    def stats(self) -> dict:
+        return {task: {"model": self.tiers[self.tier(task)], "downgraded": task in self.downgrades} for task in self.routes}
+
+
+llm_router = LLMRouter(settings.LLM_ROUTES, settings.LLM_TIERS, settings.LLM_DOWNGRADE_SECONDS)
+metrics.gauge("llm_routes", llm_router.stats)
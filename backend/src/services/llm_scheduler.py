@@ -0,0 +1,134 @@
+"""
+Admission control for Gemini calls made by this process.
+Every call runs under a priority class:
+    interactive  - the user's live turn (reply generation and streaming)
+    evaluation   - trait extraction running alongside the turn
+    background   - recommendations, summaries and other work nobody is waiting on
+Interactive calls have a reserved pool, so background bursts never delay a live turn.
+Evaluation and background calls share a second pool, in which queued evaluation calls are
+always admitted first. Background work is shed (LLMOverloaded) once its queue is full or it
+has waited too long, leaving callers to fall back or retry later.
+"""
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+import asyncio
+import logging
+import time
+from src.core.config import settings
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "evaluation", "background")
+# Classes drawing on the shared pool, in admission order
+SHARED_PRIORITIES = ("evaluation", "background")
+
+
+class LLMOverloaded(Exception):
+    """Raised when background work is shed instead of queued."""
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        shared_limit: int,
+        background_max_queue: int,
+        background_max_wait: float
+    ):
+        self.limits = limits
+        self.shared_limit = shared_limit
+        self.background_max_queue = background_max_queue
+        self.background_max_wait = background_max_wait
+        self.running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self.waiting: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+
+    def _shared_running(self) -> int:
+        return sum(self.running[p] for p in SHARED_PRIORITIES)
+
+    def _admissible(self, priority: str) -> bool:
+        if self.running[priority] >= self.limits[priority]:
+            return False
+        return priority == "interactive" or self._shared_running() < self.shared_limit
+
+    def _ahead(self, priority: str) -> bool:
+        # Whether someone queued at this priority or above would be overtaken
+        if self.waiting[priority]:
+            return True
+        return priority == "background" and bool(self.waiting["evaluation"])
+
+    async def acquire(self, priority: str) -> None:
+        started = time.monotonic()
+        if not self._ahead(priority) and self._admissible(priority):
+            self.running[priority] += 1
+            metrics.observe("llm_queue_seconds", 0.0, priority=priority)
+            return
+        if priority == "background" and len(self.waiting[priority]) >= self.background_max_queue:
+            metrics.incr("llm_shed", priority=priority, reason="queue_full")
+            raise LLMOverloaded("background LLM queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].append(future)
+        try:
+            if priority == "background":
+                await asyncio.wait_for(asyncio.shield(future), self.background_max_wait)
+            else:
+                await future
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Admitted just as we gave up: hand the slot on
+                self.release(priority)
+            else:
+                future.cancel()
+                if future in self.waiting[priority]:
+                    self.waiting[priority].remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.incr("llm_shed", priority=priority, reason="timeout")
+                raise LLMOverloaded(f"background LLM call waited over {self.background_max_wait}s")
+            raise
+        waited = time.monotonic() - started
+        metrics.observe("llm_queue_seconds", waited, priority=priority)
+        if waited > 1:
+            logger.info(f"{priority} LLM call queued for {waited:.2f}s")
+
+    def release(self, priority: str) -> None:
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            queue = self.waiting[priority]
+            while queue and self._admissible(priority):
+                future = queue.popleft()
+                if future.done():
+                    continue
+                self.running[priority] += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> dict:
+        return {
+            p: {"running": self.running[p], "queued": len(self.waiting[p]), "limit": self.limits[p]}
+            for p in PRIORITIES
+        }
+
+
+llm_scheduler = LLMScheduler(
+    limits={
+        "interactive": settings.LLM_CONCURRENCY_INTERACTIVE,
+        "evaluation": settings.LLM_CONCURRENCY_EVALUATION,
+        "background": settings.LLM_CONCURRENCY_BACKGROUND,
+    },
+    shared_limit=settings.LLM_CONCURRENCY_SHARED,
+    background_max_queue=settings.LLM_BACKGROUND_MAX_QUEUE,
+    background_max_wait=settings.LLM_BACKGROUND_MAX_WAIT_SECONDS
+)
+metrics.gauge("llm_scheduler", llm_scheduler.stats)
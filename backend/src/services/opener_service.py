@@ -0,0 +1,176 @@
+"""
+Pool of pre-generated first replies for brand-new conversations.
+With an empty profile and no conversation yet, the first assistant turn is generated from
+the same prompt for everyone, so a pool of them is generated ahead of time, stored in the
+`openers` collection and rotated per user. The pool is regenerated in the background when
+it is short, older than OPENER_MAX_AGE_SECONDS, or the conversation prompt has changed.
+Only the process holding the refresh lease (a `refreshing_until` document in the same
+collection) regenerates it, so instances that notice a stale pool together don't all call Gemini.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import hashlib
+import logging
+import time
+from src.clients.mongo_client import get_database
+from src.core.metrics import metrics
+from src.models.pydantic.profile import Profile
+from src.services.trait_gate import GREETINGS, normalize_message
+
+logger = logging.getLogger(__name__)
+
+OPENER_POOL_SIZE = 12
+OPENER_MAX_AGE_SECONDS = 24 * 3600
+# How often the in-process copy of the pool is re-read from Mongo
+OPENER_RELOAD_SECONDS = 600
+# The user message the pool is generated against
+OPENER_SEED_MESSAGE = "Hi"
+# A refresh that fails or whose process dies holds the lease this long, so retries back off
+OPENER_REFRESH_LEASE_SECONDS = 300
+OPENER_LEASE_ID = "refresh_lease"
+
+
+class OpenerService:
+    def __init__(self, conversation_service):
+        self.conversation_service = conversation_service
+        self.collection = get_database()["openers"]
+        self.pool: List[str] = []
+        self.version = self.prompt_version()
+        self._loaded_at: Optional[float] = None
+        self._pool_created_at: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def seed_prompt(self) -> str:
+        profile = Profile(_id=ObjectId(), user_id=ObjectId(), traits={}, updated_at=datetime.utcnow())
+        return self.conversation_service._build_prompt(profile, [{"role": "user", "content": OPENER_SEED_MESSAGE}])
+
+    def prompt_version(self) -> str:
+        # Openers are only valid for the prompt they were generated from
+        text = self.conversation_service.static_prefix + self.seed_prompt()
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def eligible(user_profile, conversation_history) -> bool:
+        """
+        A pooled opener fits only the very first turn of an empty profile, answering a bare greeting
+        ("hi", "hello there"); anything else may say something the reply should respond to.
+        """
+        if user_profile.traits or user_profile.conversation_summary:
+            return False
+        history = conversation_history or []
+        if any(m.get("role") == "assistant" for m in history):
+            return False
+        user_messages = [m for m in history if m.get("role") == "user"]
+        if len(user_messages) > 1:
+            return False
+        if not user_messages:
+            return True
+        return normalize_message(str(user_messages[-1].get("content", ""))) in GREETINGS
+
+    async def pick(self, user_id) -> Optional[str]:
+        """
+        The user's opener from the pool, or None if the pool is empty. Each user gets a
+        stable pick, and different users are spread across the pool.
+        """
+        await self._ensure_loaded()
+        if len(self.pool) < OPENER_POOL_SIZE or not self._pool_is_fresh(self._pool_created_at):
+            self.schedule_refresh()
+        if not self.pool:
+            metrics.incr("opener_pool_misses")
+            return None
+        index = int(hashlib.sha256(str(user_id).encode("utf-8")).hexdigest(), 16) % len(self.pool)
+        metrics.incr("opener_pool_hits")
+        return self.pool[index]
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < OPENER_RELOAD_SECONDS:
+            return
+        self._loaded_at = time.monotonic()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=OPENER_MAX_AGE_SECONDS)
+            docs = await self.collection.find(
+                {"version": self.version, "created_at": {"$gt": cutoff}}
+            ).sort("created_at", -1).limit(OPENER_POOL_SIZE).to_list(length=OPENER_POOL_SIZE)
+            # Sorted by id so a user's pick doesn't move around between reloads of the same pool
+            self.pool = [d["text"] for d in sorted(docs, key=lambda d: d["_id"])]
+            self._pool_created_at = min((d["created_at"] for d in docs), default=None)
+        except Exception as e:
+            logger.error(f"Failed to load opener pool: {e}")
+
+    @staticmethod
+    def _pool_is_fresh(created_at: Optional[datetime]) -> bool:
+        # Regenerate ahead of expiry so the pool never runs dry
+        return created_at is not None and datetime.utcnow() - created_at <= timedelta(seconds=OPENER_MAX_AGE_SECONDS / 2)
+
+    def schedule_refresh(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def _take_lease(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": OPENER_LEASE_ID, "refreshing_until": {"$lt": now}},
+                {"$set": {"refreshing_until": now + timedelta(seconds=OPENER_REFRESH_LEASE_SECONDS)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another process holds the lease
+            return False
+
+    async def _release_lease(self) -> None:
+        await self.collection.update_one({"_id": OPENER_LEASE_ID}, {"$set": {"refreshing_until": datetime.utcnow()}})
+
+    async def refresh(self) -> None:
+        """
+        Generate a full pool for the current prompt and drop openers from older pools,
+        unless another process holds the refresh lease or has just written a fresh pool.
+        """
+        try:
+            if not await self._take_lease():
+                return
+            cutoff = datetime.utcnow() - timedelta(seconds=OPENER_MAX_AGE_SECONDS / 2)
+            fresh = await self.collection.count_documents({"version": self.version, "created_at": {"$gt": cutoff}})
+            if fresh >= OPENER_POOL_SIZE:
+                # Regenerated elsewhere since this process last read the pool
+                self._loaded_at = None
+                await self._release_lease()
+                return
+            prompt = self.seed_prompt()
+            results = await asyncio.gather(*[
+                self.conversation_service.gemini.generate(
+                    prompt,
+                    static_prefix=self.conversation_service.static_prefix,
+                    task="opener",
+                    # Some variety between openers
+                    config={"temperature": 1.0}
+                )
+                for _ in range(OPENER_POOL_SIZE)
+            ], return_exceptions=True)
+            texts = [r.text.strip() for r in results if not isinstance(r, Exception) and r.text and r.text.strip()]
+            if not texts:
+                # The lease is kept until it expires, so the next attempt waits
+                logger.warning("Opener pool refresh produced nothing")
+                return
+            now = datetime.utcnow()
+            await self.collection.insert_many([
+                {"text": t, "version": self.version, "created_at": now} for t in texts
+            ])
+            await self.collection.delete_many({
+                "_id": {"$ne": OPENER_LEASE_ID},
+                "$or": [
+                    {"version": {"$ne": self.version}},
+                    {"created_at": {"$lt": now}},
+                ],
+            })
+            await self._release_lease()
+            self._loaded_at = None
+            logger.info(f"Opener pool refreshed with {len(texts)} openers")
+            metrics.incr("opener_pool_refreshes")
+        except Exception as e:
+            logger.error(f"Failed to refresh opener pool: {e}")
@@ -4,15 +4,19 @@ Coordinates user message handling, profile management, conversation turn generat
 All chat/advising flows should go through this service.
 """
 from bson import ObjectId
-from src.services.profile_service import ProfileService
+from src.services.profile_service import ProfileService, ProfileTurn
 from src.services.conversation_service import ConversationService
 from src.services.evaluation_service import EvaluationService
 from src.services.recommendation_service import RecommendationService
-import asyncio
+from src.services.session_service import SessionService
+from src.services.recommendation_scheduler import recommendation_scheduler
+from src.services.recommendation_queue import RecommendationJobQueue
+from src.core.config import settings
 from src.models.pydantic.profile import Trait, ChatMessage, Alert, AlertType
 from datetime import datetime
 from src.clients.mongo_client import get_database
-from typing import Dict, Any, List, Optional
+from src.core.metrics import metrics
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,75 +31,199 @@ class OrchestratorService:
         self.conversation_service = ConversationService()
         self.evaluation_service = EvaluationService()
         self.recommendation_service = RecommendationService()
+        self.session_service = SessionService()
+        self.recommendation_queue = RecommendationJobQueue(debounce_seconds=settings.RECOMMENDATION_DEBOUNCE_SECONDS)
         self.db = get_database()
 
-    async def process_user_message(
-        self, 
-        user_id: ObjectId, 
-        user_message: str, 
-        conversation_history: Optional[List[Dict[str, Any]]] = None
-    ) -> dict:
+    async def begin_turn(self, user_id: ObjectId) -> ProfileTurn:
         """
-        Process a user message: update profile, save chat, evaluate traits, and return updated profile and alerts.
+        Start a chat turn: reads the profile once and collects the turn's writes until commit_turn.
+        """
+        return await self.profile_service.begin_turn(user_id)
+
+    async def commit_turn(self, turn: ProfileTurn, session_id: Optional[str] = None) -> None:
+        """
+        Write everything the turn collected in one bulk write, then schedule a
+        recommendation refresh if a trait was merged. For server-side sessions the written messages
+        are also appended to the cached conversation window.
+        """
+        traits_updated = bool(turn.traits)
+        messages = list(turn.messages)
+        await turn.commit()
+        if session_id:
+            self.session_service.record(turn.user_id, session_id, messages)
+        if traits_updated and len(turn.profile.traits) >= 1:
+            await self.schedule_recommendations(turn.user_id, turn.profile)
+
+    async def schedule_recommendations(self, user_id: ObjectId, profile) -> None:
         """
-        profile = await self.profile_service.get_profile(user_id)
-        if not profile:
-            profile = await self.profile_service.create_profile(user_id)
-            logger.info(f"Created new profile for user_id={user_id}")
+        Refresh the user's recommendations outside the request. In durable mode the request only
+        enqueues a job for the recommendation worker; in local mode bursts are coalesced per user
+        in this process, so only the newest profile is used and refreshes never overlap.
+        Until Gemini's recommendations arrive, a local answer is stored so the user sees something at once.
+        """
+        if settings.RECOMMENDATION_FAST_FIRST_ANSWER and self._has_only_local_recommendations(profile):
+            try:
+                recs = self.recommendation_service.recommend_locally(profile.dict())
+                if recs:
+                    await self.profile_service.update_courses_recommendation(user_id, recs)
+                    profile.courses_recommendation = recs
+            except Exception as e:
+                logger.error(f"Failed to store local recommendations for user_id={user_id}: {e}")
+        if settings.RECOMMENDATION_QUEUE == "durable":
+            try:
+                await self.recommendation_queue.enqueue(user_id)
+            except Exception as e:
+                logger.error(f"Failed to enqueue recommendation job for user_id={user_id}: {e}")
+            return
+        recommendation_scheduler.submit(user_id, lambda: self._update_recommendations(user_id, profile))
 
-        # Save user message to chat_history
+    def record_user_message(self, turn: ProfileTurn, user_message: str) -> None:
+        """
+        Add the user's message to the turn's chat history writes.
+        """
         user_msg = ChatMessage(
             role="user",
             content=user_message,
             timestamp=datetime.utcnow(),
             alert=[]
         )
-        await self.profile_service.append_chat_history(user_id, user_msg)
+        turn.append_chat_history(user_msg)
 
-        alert_for_update = None
-        if user_message:
-            last_turn = self._get_last_assistant_message(conversation_history)
+    async def evaluate_user_message(
+        self,
+        turn: ProfileTurn,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Alert]:
+        """
+        Evaluate the user's message for trait information and merge any trait found into the turn.
+        Returns the alerts to show for this turn.
+        """
+        if not user_message:
+            return []
+        last_turn = self._get_last_assistant_message(conversation_history)
+        try:
             eval_result = await self.evaluation_service.evaluate_answer(last_turn, user_message)
-            if (
-                eval_result
-                and isinstance(eval_result, dict)
-                and eval_result.get("trait")
-                and eval_result.get("label")
-                and eval_result.get("confidence") is not None
-                and eval_result.get("evidence")
-                and eval_result.get("timestamp")
-            ):
-                trait = Trait(**eval_result)
-                profile = await self.profile_service.merge_trait(user_id, trait)
-                logger.info(f"Profile updated with new trait for user_id={user_id}")
-                alert_for_update = Alert(type=AlertType.profile_update, message="Profile has been updated.")
-
-                # Trigger recommendations in the background
-                if len(profile.traits) >= 1:
-                    asyncio.create_task(self._update_recommendations(user_id, profile))
+        except Exception as e:
+            # Evaluation can run alongside the reply stream, so it must never fail the turn
+            logger.error(f"Evaluation failed for user_id={turn.user_id}: {e}")
+            return []
+        if (
+            eval_result
+            and isinstance(eval_result, dict)
+            and eval_result.get("trait")
+            and eval_result.get("label")
+            and eval_result.get("confidence") is not None
+            and eval_result.get("evidence")
+            and eval_result.get("timestamp")
+        ):
+            trait = Trait(**eval_result)
+            turn.merge_trait(trait)
+            logger.info(f"Profile updated with new trait for user_id={turn.user_id}")
+            return [Alert(type=AlertType.profile_update, message="Profile has been updated.")]
+        return []
+
+    async def process_user_message(
+        self, 
+        user_id: ObjectId, 
+        user_message: str, 
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        turn: Optional[ProfileTurn] = None
+    ) -> dict:
+        """
+        Process a user message: update profile, save chat, evaluate traits, and return updated profile and alerts.
+        When a turn is passed in, its writes are left for the caller to commit together with the
+        assistant reply; otherwise they are committed before returning.
+        """
+        own_turn = turn is None
+        if own_turn:
+            turn = await self.begin_turn(user_id)
+
+        self.record_user_message(turn, user_message)
+        alerts = await self.evaluate_user_message(turn, user_message, conversation_history)
+
+        if own_turn:
+            await self.commit_turn(turn)
 
         logger.info("returning message response!")
         return {
-            "profile": profile,
-            "alert": [alert_for_update] if alert_for_update else []
+            "profile": turn.profile,
+            "alert": alerts,
+            "turn": turn
         }
 
     async def _update_recommendations(self, user_id: ObjectId, profile):
+        try:
+            await self.refresh_recommendations(user_id, profile)
+        except Exception as e:
+            logger.error(f"Failed to update courses_recommendation for user_id={user_id}: {e}")
+
+    async def refresh_recommendations(self, user_id: ObjectId, profile) -> None:
         """
         Generate and store recommendations for the user profile, but only update if the new list is not smaller than the existing one.
+        Raises if no recommendations could be generated, so queued jobs are retried.
         """
-        try:
-            logger.info(f"Starting recommendation update for user_id={user_id}")
-            recs = await self.recommendation_service.recommend_courses(profile.dict())
-            logger.info(f"Generated {len(recs)} recommendations for user_id={user_id}")
-            existing_recs = await self.profile_service.get_courses_recommendation(user_id)
-            if len(recs) >= len(existing_recs):
+        profile_doc = profile.dict()
+        fingerprint = self.recommendation_service.fingerprint(profile_doc)
+        if fingerprint == profile.recommendation_fingerprint:
+            metrics.incr("recommendation_llm_calls_saved", reason="unchanged")
+            logger.info(f"Trait fingerprint unchanged for user_id={user_id}, keeping recommendations ({self._recommendation_hit_rate()})")
+            return
+        logger.info(f"Starting recommendation update for user_id={user_id}")
+        recs = await self.recommendation_service.recommend_courses(profile_doc)
+        if not recs:
+            raise RuntimeError("no recommendations generated")
+        logger.info(f"Generated {len(recs)} recommendations for user_id={user_id} ({self._recommendation_hit_rate()})")
+        existing_recs = await self.profile_service.get_courses_recommendation(user_id)
+        from_llm = recs[0].get("source") != "local"
+        if not from_llm:
+            # Gemini was unavailable: a local answer may only replace another local one,
+            # and it is not fingerprinted so the next refresh asks Gemini again
+            if self._has_only_local_recommendations(existing_recs):
                 await self.profile_service.update_courses_recommendation(user_id, recs)
-                logger.info(f"Updated courses_recommendation for user_id={user_id}")
-            else:
-                logger.info(f"Did not update courses_recommendation for user_id={user_id} because new recommendations ({len(recs)}) < existing ({len(existing_recs)})")
-        except Exception as e:
-            logger.error(f"Failed to update courses_recommendation for user_id={user_id}: {e}")
+            raise RuntimeError("Gemini recommendations unavailable, served local ones")
+        if len(recs) >= len(existing_recs) or self._has_only_local_recommendations(existing_recs):
+            await self.profile_service.update_courses_recommendation(user_id, recs, fingerprint)
+            profile.recommendation_fingerprint = fingerprint
+            logger.info(f"Updated courses_recommendation for user_id={user_id}")
+        else:
+            logger.info(f"Did not update courses_recommendation for user_id={user_id} because new recommendations ({len(recs)}) < existing ({len(existing_recs)})")
+
+    @staticmethod
+    def _has_only_local_recommendations(profile_or_recs) -> bool:
+        recs = getattr(profile_or_recs, "courses_recommendation", profile_or_recs) or []
+        return all(r.get("source") == "local" for r in recs)
+
+    @staticmethod
+    def _recommendation_hit_rate() -> str:
+        counters = metrics.snapshot()["counters"]
+        saved = sum(v for k, v in counters.items() if k.startswith("recommendation_llm_calls_saved"))
+        calls = counters.get("recommendation_llm_calls", 0)
+        total = saved + calls
+        rate = saved / total if total else 0.0
+        return f"recommendation cache hit rate {rate:.0%}, {saved:.0f} Gemini calls saved"
+
+    async def resolve_conversation(
+        self,
+        user_id: ObjectId,
+        user_message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+        session_id: Optional[str] = None,
+        message_saved: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the conversation to use for this turn, ending with the new user message.
+        In session mode the server-side window is used and any client-sent history is ignored;
+        `message_saved` means the message is already stored (e.g. by /alert-info), so the window
+        already ends with it.
+        """
+        if not session_id:
+            return conversation_history or []
+        window = await self.session_service.get_window(user_id, session_id)
+        if not message_saved:
+            window.append({"role": "user", "content": user_message})
+        return window
 
     @staticmethod
     def _get_last_assistant_message(conversation_history: Optional[List[Dict[str, Any]]]) -> Optional[str]:
@@ -115,8 +243,21 @@ class OrchestratorService:
         """
         return await self.profile_service.get_chat_history(user_id)
 
+    async def get_chat_history_page(
+        self,
+        user_id: ObjectId,
+        before: Optional[int] = None,
+        limit: int = 50
+    ) -> Tuple[List[ChatMessage], Optional[int]]:
+        """
+        Fetch a page of the user's chat history, newest page first.
+        Returns the messages (oldest first within the page) and the cursor for older messages.
+        """
+        return await self.profile_service.get_chat_history_page(user_id, before=before, limit=limit)
+
     async def clear_chat_history(self, user_id: ObjectId) -> None:
         """
         Clear the user's chat/turn history in the profile document.
         """
-        await self.profile_service.clear_chat_history(user_id) 
\ No newline at end of file
+        await self.profile_service.clear_chat_history(user_id)
+        self.session_service.forget(user_id) 
\ No newline at end of file
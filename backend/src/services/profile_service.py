@@ -1,29 +1,79 @@
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
 from src.clients.mongo_client import get_database
-from src.models.pydantic.profile import Profile, Trait, PyObjectId, ChatMessage, Alert
-from typing import Dict, Any, List
+from src.models.pydantic.profile import Profile, Trait, TraitEvidence, PyObjectId, ChatMessage, Alert, ConversationSummary, TRAIT_HISTORY_LIMIT, fold_trait
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _evidence_entry(trait_ref: str) -> dict:
+    return {
+        "label": f"{trait_ref}.label",
+        "confidence": f"{trait_ref}.confidence",
+        "evidence": f"{trait_ref}.evidence",
+        "timestamp": f"{trait_ref}.timestamp",
+    }
+
+# Aggregation expression folding a legacy append-only `traits` array into the keyed form.
+# Sorting by confidence lets $arrayToObject keep the most confident (then newest) entry per trait,
+# matching fold_trait; each trait's history is rebuilt from its own entries.
+COMPACT_TRAITS_EXPR = {
+    "$cond": [
+        {"$isArray": "$traits"},
+        {"$arrayToObject": {"$map": {
+            "input": {"$sortArray": {"input": "$traits", "sortBy": {"confidence": 1, "timestamp": 1}}},
+            "as": "t",
+            "in": {
+                "k": "$$t.trait",
+                "v": {"$mergeObjects": ["$$t", {"history": {"$slice": [
+                    {"$map": {
+                        "input": {"$filter": {"input": "$traits", "as": "h", "cond": {"$eq": ["$$h.trait", "$$t.trait"]}}},
+                        "as": "h",
+                        "in": _evidence_entry("$$h"),
+                    }},
+                    -TRAIT_HISTORY_LIMIT
+                ]}}]},
+            },
+        }}},
+        {"$ifNull": ["$traits", {}]},
+    ]
+}
+
 class ProfileService:
     def __init__(self):
         self.db = get_database()
         self.collection = self.db["profiles"]
 
-    async def get_profile(self, user_id: ObjectId) -> Profile:
-        doc = await self.collection.find_one({"user_id": user_id})
+    async def get_profile(self, user_id: ObjectId, include_chat_history: bool = True) -> Profile:
+        projection = None if include_chat_history else {"chat_history": 0}
+        doc = await self.collection.find_one({"user_id": user_id}, projection)
         if doc:
             return Profile(**doc)
         return None
 
+    async def begin_turn(self, user_id: ObjectId) -> "ProfileTurn":
+        """
+        Read the profile once for a chat turn (without its chat history) and return a
+        ProfileTurn that collects the turn's writes. A missing profile is created on commit.
+        """
+        docs = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$set": {"chat_history_count": {"$size": {"$ifNull": ["$chat_history", []]}}}},
+            {"$unset": "chat_history"},
+        ]).to_list(length=1)
+        if docs:
+            return ProfileTurn(self.collection, Profile(**docs[0]))
+        profile = Profile(_id=user_id, user_id=user_id, traits={}, updated_at=datetime.utcnow(), chat_history_count=0)
+        return ProfileTurn(self.collection, profile, is_new=True)
+
     async def create_profile(self, user_id: ObjectId) -> Profile:
         now = datetime.utcnow()
         doc = {
             "_id": user_id,
             "user_id": user_id,
-            "traits": [],
+            "traits": {},
             "updated_at": now,
             "chat_history": []
         }
@@ -42,22 +92,153 @@ class ProfileService:
             return []
         return [ChatMessage(**msg) for msg in doc.get("chat_history", [])]
 
+    async def get_chat_history_page(
+        self,
+        user_id: ObjectId,
+        before: Optional[int] = None,
+        limit: int = 50
+    ) -> Tuple[List[ChatMessage], Optional[int]]:
+        """
+        Fetch one page of chat history without loading the whole array.
+        `before` is the position (exclusive) of the oldest message already seen;
+        omit it to get the newest `limit` messages. Messages are returned oldest
+        first within the page, along with the cursor for the next (older) page.
+        """
+        if before is None:
+            # Newest page: slice from the end, counting the array server-side
+            end = {"$size": {"$ifNull": ["$chat_history", []]}}
+        else:
+            end = {"$min": [before, {"$size": {"$ifNull": ["$chat_history", []]}}]}
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$project": {"_id": 0, "end": end, "chat_history": 1}},
+            {"$project": {
+                "start": {"$max": [{"$subtract": ["$end", limit]}, 0]},
+                "end": 1,
+                "chat_history": 1,
+            }},
+            {"$project": {
+                "start": 1,
+                "messages": {
+                    "$cond": [
+                        {"$gt": ["$end", "$start"]},
+                        {"$slice": [{"$ifNull": ["$chat_history", []]}, "$start", {"$subtract": ["$end", "$start"]}]},
+                        [],
+                    ]
+                },
+            }},
+        ]
+        docs = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not docs:
+            return [], None
+        start = docs[0]["start"]
+        messages = [ChatMessage(**msg) for msg in docs[0].get("messages", [])]
+        return messages, (start if start > 0 else None)
+
+    async def get_chat_history_length(self, user_id: ObjectId) -> int:
+        """
+        Number of stored chat messages, counted server-side without loading them.
+        """
+        docs = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$project": {"_id": 0, "total": {"$size": {"$ifNull": ["$chat_history", []]}}}},
+        ]).to_list(length=1)
+        return docs[0]["total"] if docs else 0
+
     async def clear_chat_history(self, user_id: ObjectId) -> None:
         await self.collection.update_one(
             {"user_id": user_id},
-            {"$set": {"chat_history": []}}
+            {"$set": {"chat_history": []}, "$unset": {"conversation_summary": ""}}
         )
 
+    async def get_summary_state(self, user_id: ObjectId) -> Tuple[Optional[ConversationSummary], int]:
+        """
+        Return the stored conversation summary and the number of stored chat messages,
+        without loading the chat history itself.
+        """
+        docs = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$project": {
+                "_id": 0,
+                "conversation_summary": 1,
+                "total": {"$size": {"$ifNull": ["$chat_history", []]}},
+            }},
+        ]).to_list(length=1)
+        if not docs:
+            return None, 0
+        summary = docs[0].get("conversation_summary")
+        return (ConversationSummary(**summary) if summary else None), docs[0]["total"]
+
+    async def update_conversation_summary(
+        self,
+        user_id: ObjectId,
+        summary: ConversationSummary,
+        previous_count: int
+    ) -> bool:
+        """
+        Store a refreshed summary, but only if no other refresh has moved it on since it was read
+        and the chat still holds the messages it covers (it may have been cleared meanwhile).
+        """
+        query: Dict[str, Any] = {
+            "user_id": user_id,
+            "$expr": {"$gte": [{"$size": {"$ifNull": ["$chat_history", []]}}, summary.message_count]},
+        }
+        if previous_count:
+            query["conversation_summary.message_count"] = previous_count
+        else:
+            query["conversation_summary"] = None
+        result = await self.collection.update_one(query, {"$set": {"conversation_summary": summary.dict()}})
+        return result.modified_count == 1
+
+    @staticmethod
+    def _merge_trait_pipeline(trait: Trait, now: datetime) -> list:
+        """
+        Update pipeline that upserts a trait under its key: the more confident label wins
+        (ties go to the new one) and the evaluation joins the capped history. Mirrors fold_trait.
+        """
+        path = f"$traits.{trait.trait}"
+        current = trait.dict(exclude={"history"})
+        entry = TraitEvidence(**current).dict()
+        return [
+            {"$set": {"traits": COMPACT_TRAITS_EXPR}},
+            {"$set": {
+                f"traits.{trait.trait}": {"$mergeObjects": [
+                    {"$cond": [
+                        {"$or": [
+                            {"$eq": [{"$type": path}, "missing"]},
+                            {"$gte": [trait.confidence, f"{path}.confidence"]},
+                        ]},
+                        {"$literal": current},
+                        path,
+                    ]},
+                    {"history": {"$slice": [
+                        {"$concatArrays": [{"$ifNull": [f"{path}.history", []]}, [{"$literal": entry}]]},
+                        -TRAIT_HISTORY_LIMIT
+                    ]}},
+                ]},
+                "updated_at": now,
+            }},
+        ]
+
     async def merge_trait(self, user_id: ObjectId, trait: Trait) -> Profile:
         now = datetime.utcnow()
-        # Add new trait to the list (append)
-        result = await self.collection.update_one(
+        doc = await self.collection.find_one_and_update(
             {"user_id": user_id},
-            {"$push": {"traits": trait.dict()}, "$set": {"updated_at": now}}
+            self._merge_trait_pipeline(trait, now),
+            return_document=ReturnDocument.AFTER
         )
-        # Return updated profile
-        doc = await self.collection.find_one({"user_id": user_id})
-        return Profile(**doc)
+        return Profile(**doc) if doc else None
+
+    async def compact_legacy_traits(self) -> int:
+        """
+        One-off migration: rewrite profiles that still store traits as an append-only list.
+        Returns the number of profiles modified.
+        """
+        result = await self.collection.update_many(
+            {"traits": {"$type": "array"}},
+            [{"$set": {"traits": COMPACT_TRAITS_EXPR}}]
+        )
+        return result.modified_count
 
     async def get_courses_recommendation(self, user_id: ObjectId) -> list:
         doc = await self.collection.find_one({"user_id": user_id})
@@ -65,10 +246,63 @@ class ProfileService:
             return doc["courses_recommendation"]
         return []
 
-    async def update_courses_recommendation(self, user_id: ObjectId, recommendations: list) -> None:
+    async def update_courses_recommendation(self, user_id: ObjectId, recommendations: list, fingerprint: Optional[str] = None) -> None:
         logger.info(f"Storing {len(recommendations)} recommendations for user_id={user_id}")
+        update = {"courses_recommendation": recommendations}
+        if fingerprint:
+            update["recommendation_fingerprint"] = fingerprint
         await self.collection.update_one(
             {"user_id": user_id},
-            {"$set": {"courses_recommendation": recommendations}}
+            {"$set": update}
         )
         logger.info(f"Successfully stored recommendations for user_id={user_id}")
+
+class ProfileTurn:
+    """
+    Unit of work for one chat turn. Mutations are applied to the in-memory profile right away
+    and written together in a single ordered bulk write by commit().
+    """
+    def __init__(self, collection, profile: Profile, is_new: bool = False):
+        self.collection = collection
+        self.profile = profile
+        self.is_new = is_new
+        self.messages: List[ChatMessage] = []
+        self.traits: List[Trait] = []
+
+    @property
+    def user_id(self) -> ObjectId:
+        return self.profile.user_id
+
+    def append_chat_history(self, message: ChatMessage) -> None:
+        self.messages.append(message)
+
+    def merge_trait(self, trait: Trait) -> Profile:
+        self.traits.append(trait)
+        self.profile.traits[trait.trait] = fold_trait(self.profile.traits.get(trait.trait), trait)
+        self.profile.updated_at = trait.timestamp
+        return self.profile
+
+    async def commit(self) -> None:
+        """
+        Write the collected mutations: chat messages (and profile creation) in one upsert,
+        followed by one pipeline update per merged trait. Safe to call more than once.
+        """
+        now = datetime.utcnow()
+        ops = []
+        if self.messages or self.is_new:
+            update: Dict[str, Any] = {}
+            if self.messages:
+                update["$push"] = {"chat_history": {"$each": [m.dict(by_alias=True) for m in self.messages]}}
+            if self.is_new:
+                update["$setOnInsert"] = {"_id": self.user_id, "traits": {}, "updated_at": now}
+            ops.append(UpdateOne({"user_id": self.user_id}, update, upsert=self.is_new))
+        for trait in self.traits:
+            ops.append(UpdateOne({"user_id": self.user_id}, ProfileService._merge_trait_pipeline(trait, now)))
+        if not ops:
+            return
+        await self.collection.bulk_write(ops, ordered=True)
+        if self.is_new:
+            logger.info(f"Created new profile for user_id={self.user_id}")
+        self.messages = []
+        self.traits = []
+        self.is_new = False
@@ -0,0 +1,92 @@
+"""
+In-process index from course name to the programs that teach it.
+Each course's programs are pre-sorted by institution rank (Malaysia rank, then world rank)
+and tuition, so attaching the best programs to a recommendation is a dictionary lookup.
+The index is rebuilt from the catalog on first use and again after PROGRAM_INDEX_TTL_SECONDS,
+so a catalog reload is picked up without restarting.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+from src.clients.mongo_client import get_database
+
+logger = logging.getLogger(__name__)
+
+PROGRAM_INDEX_TTL_SECONDS = 3600
+# Sorts after every real rank or fee
+UNRANKED = float("inf")
+
+
+def _program_sort_key(program: dict) -> tuple:
+    return (
+        program.get("malaysia_rank") or UNRANKED,
+        program.get("world_rank") or UNRANKED,
+        program.get("tuition_fee") if program.get("tuition_fee") is not None else UNRANKED,
+        program["program_name"],
+    )
+
+
+class ProgramIndex:
+    def __init__(self, ttl_seconds: float = PROGRAM_INDEX_TTL_SECONDS):
+        self.db = get_database()
+        self.ttl_seconds = ttl_seconds
+        self.by_course: Dict[str, List[dict]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def load(self) -> None:
+        """
+        Rebuild the index from the programs and institutions collections.
+        """
+        institutions = {}
+        async for inst in self.db["institutions"].find(
+            {}, {"institution_name": 1, "malaysia_rank": 1, "world_rank": 1, "program_ids": 1}
+        ):
+            for pid in inst.get("program_ids") or []:
+                institutions[pid] = inst
+
+        by_course: Dict[str, List[dict]] = {}
+        async for prog in self.db["programs"].find(
+            {"course": {"$ne": None}},
+            {"program_name": 1, "course": 1, "location": 1, "program_type": 1,
+             "program_duration_years": 1, "fees.tuition_fee": 1}
+        ):
+            inst = institutions.get(prog["_id"]) or {}
+            by_course.setdefault(prog["course"].lower(), []).append({
+                "_id": str(prog["_id"]),
+                "program_name": prog.get("program_name"),
+                "program_type": prog.get("program_type"),
+                "location": prog.get("location"),
+                "program_duration_years": prog.get("program_duration_years"),
+                "tuition_fee": (prog.get("fees") or {}).get("tuition_fee"),
+                "institution_id": str(inst["_id"]) if inst else None,
+                "institution_name": inst.get("institution_name"),
+                "malaysia_rank": inst.get("malaysia_rank"),
+                "world_rank": inst.get("world_rank"),
+            })
+        for programs in by_course.values():
+            programs.sort(key=_program_sort_key)
+        self.by_course = by_course
+        self._loaded_at = time.monotonic()
+        logger.info(f"Program index built: {sum(len(p) for p in by_course.values())} programs across {len(by_course)} courses")
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return
+            try:
+                await self.load()
+            except Exception as e:
+                # Keep serving the previous index; retry on the next request
+                logger.error(f"Failed to build program index: {e}")
+
+    def top_programs(self, course: str, n: int) -> List[dict]:
+        return self.by_course.get(course.lower(), [])[:n]
+
+
+program_index = ProgramIndex()
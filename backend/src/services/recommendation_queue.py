@@ -0,0 +1,115 @@
+"""
+Durable queue of recommendation refreshes, stored in the `recommendation_jobs` collection.
+There is one job document per user, so repeated enqueues coalesce. A worker claims a job
+atomically with a lease; a job whose worker dies is claimed again once the lease runs out.
+Failed jobs are retried with exponential backoff up to RECOMMENDATION_JOB_MAX_ATTEMPTS.
+
+Job document:
+    _id: user_id
+    status: "queued" | "running" | "failed"
+    requested_at: last time a refresh was asked for
+    run_after: earliest time the job may be claimed (debounce and retry backoff)
+    claimed_at / lease_until / worker: set while running
+    attempts, error: retry bookkeeping
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+import logging
+from src.clients.mongo_client import get_database
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_JOB_LEASE_SECONDS = 120
+RECOMMENDATION_JOB_MAX_ATTEMPTS = 5
+RECOMMENDATION_JOB_RETRY_BASE_SECONDS = 30
+
+
+class RecommendationJobQueue:
+    def __init__(self, debounce_seconds: float = 0.0):
+        self.db = get_database()
+        self.collection = self.db["recommendation_jobs"]
+        self.debounce_seconds = debounce_seconds
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("status", 1), ("run_after", 1)])
+        await self.collection.create_index([("status", 1), ("lease_until", 1)])
+
+    async def enqueue(self, user_id: ObjectId) -> None:
+        """
+        Ask for a refresh of the user's recommendations. A job already running keeps its lease
+        and is queued again when it completes, because requested_at is then newer than claimed_at.
+        """
+        now = datetime.utcnow()
+        running = {"$eq": ["$status", "running"]}
+        await self.collection.update_one(
+            {"_id": user_id},
+            [{"$set": {
+                "status": {"$cond": [running, "running", "queued"]},
+                "attempts": {"$cond": [running, "$attempts", 0]},
+                "requested_at": now,
+                "run_after": now + timedelta(seconds=self.debounce_seconds),
+            }}],
+            upsert=True
+        )
+
+    async def claim(self, worker: str) -> Optional[dict]:
+        """
+        Atomically claim the oldest due job, or a running job whose lease has expired.
+        """
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "claimed_at": now,
+                    "lease_until": now + timedelta(seconds=RECOMMENDATION_JOB_LEASE_SECONDS),
+                    "worker": worker,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def complete(self, job: dict) -> None:
+        """
+        Remove a finished job, unless a refresh was requested while it ran.
+        """
+        result = await self.collection.delete_one({
+            "_id": job["_id"],
+            "claimed_at": job["claimed_at"],
+            "requested_at": {"$lte": job["claimed_at"]},
+        })
+        if result.deleted_count == 0:
+            await self.collection.update_one(
+                {"_id": job["_id"], "claimed_at": job["claimed_at"]},
+                {"$set": {"status": "queued", "attempts": 0}, "$unset": {"lease_until": "", "worker": ""}}
+            )
+
+    async def fail(self, job: dict, error: str) -> None:
+        """
+        Schedule a retry with exponential backoff, or park the job as failed after the last attempt.
+        """
+        attempts = job.get("attempts", 1)
+        if attempts >= RECOMMENDATION_JOB_MAX_ATTEMPTS:
+            logger.error(f"Recommendation job for user_id={job['_id']} failed after {attempts} attempts: {error}")
+            update = {"status": "failed", "error": error}
+        else:
+            delay = RECOMMENDATION_JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            update = {"status": "queued", "error": error, "run_after": datetime.utcnow() + timedelta(seconds=delay)}
+        await self.collection.update_one(
+            {"_id": job["_id"], "claimed_at": job["claimed_at"]},
+            {"$set": update, "$unset": {"lease_until": "", "worker": ""}}
+        )
+
+    async def depth(self) -> dict:
+        counts = {"queued": 0, "running": 0, "failed": 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        return counts
@@ -0,0 +1,79 @@
+"""
+Background scheduler for recommendation refreshes.
+Keeps at most one running and one pending refresh per user: a burst of trait merges is debounced
+into a single refresh with the newest profile, older pending work is dropped, and a global
+semaphore caps how many refreshes call Gemini at once.
+"""
+from typing import Awaitable, Callable, Dict, Tuple
+import asyncio
+import logging
+import os
+import time
+from src.core.config import settings
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class RecommendationScheduler:
+    def __init__(self, max_concurrency: int, debounce_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.debounce_seconds = debounce_seconds
+        # user key -> (newest job, monotonic time it was submitted)
+        self._pending: Dict[str, Tuple[Job, float]] = {}
+        # user key -> task draining that user's pending job
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._in_flight = 0
+        self._semaphore: asyncio.Semaphore = None
+
+    def submit(self, user_id, job: Job) -> None:
+        """
+        Queue `job` as the user's next refresh, replacing any refresh still waiting for that user.
+        """
+        key = str(user_id)
+        if key in self._pending:
+            metrics.incr("recommendation_jobs_superseded")
+        self._pending[key] = (job, time.monotonic())
+        metrics.incr("recommendation_jobs_submitted")
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            while key in self._pending:
+                # Debounce: wait until no new job has arrived for debounce_seconds
+                wait = self._pending[key][1] + self.debounce_seconds - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                job, _ = self._pending.pop(key)
+                async with self._semaphore:
+                    self._in_flight += 1
+                    try:
+                        await job()
+                    except Exception as e:
+                        logger.error(f"Recommendation refresh failed for user_id={key}: {e}")
+                    finally:
+                        self._in_flight -= 1
+        finally:
+            self._workers.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "in_flight": self._in_flight,
+            "users": len(self._workers),
+        }
+
+
+recommendation_scheduler = RecommendationScheduler(
+    max_concurrency=settings.RECOMMENDATION_MAX_CONCURRENCY,
+    # On Lambda the container freezes once the response is sent, so a debounced refresh would
+    # still be asleep; start it at once to give it the best chance of running
+    debounce_seconds=0.0 if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else settings.RECOMMENDATION_DEBOUNCE_SECONDS
+)
+metrics.gauge("recommendation_scheduler", recommendation_scheduler.stats)
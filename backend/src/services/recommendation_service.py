@@ -1,9 +1,49 @@
 import json
+from typing import Optional
 from pathlib import Path
 from src.services.gemini_service import GeminiService
+from src.services.response_cache import ResponseCache
+from src.services.course_index import CourseIndex
+from src.services.llm_resilience import LLMUnavailable
+from src.core.config import settings
+from src.core.metrics import metrics
 import logging
 logger = logging.getLogger(__name__)
 from datetime import datetime
+import asyncio
+
+RECOMMENDATION_CACHE_TTL_SECONDS = 7 * 24 * 3600
+RECOMMENDATION_CACHE_SIZE = 1024
+# Local recommendations only include courses scoring at least this, and at least this share
+# of the best course's score; fewer than 10 is better than padding with weak matches
+LOCAL_MIN_SCORE = 0.1
+LOCAL_RELATIVE_CUTOFF = 0.3
+# course_fit for each rank of a local recommendation list: 3 best, 4 medium, 3 lower
+LOCAL_FIT_BY_RANK = [1, 1, 1, 2, 2, 2, 2, 3, 3, 3]
+# Candidate descriptions are cut to their first sentence, capped at this many characters
+CANDIDATE_DESCRIPTION_CHARS = 160
+# The local shortlist is only used when at least this many courses match and the best scores this much
+CANDIDATE_MIN_MATCHES = 15
+CANDIDATE_MIN_TOP_SCORE = 0.1
+
+def confidence_bucket(confidence: float) -> str:
+    # Small confidence changes shouldn't produce a different recommendation set
+    if confidence >= 0.8:
+        return "high"
+    if confidence >= 0.5:
+        return "medium"
+    return "low"
+
+def trait_fingerprint(traits: list) -> str:
+    """
+    Canonical fingerprint of the effective trait set: each trait's label (case-insensitive)
+    and confidence bucket, sorted by trait. Profiles with equal fingerprints get the same recommendations.
+    """
+    canonical = sorted(
+        (t["trait"], " ".join(str(t.get("label", "")).lower().split()), confidence_bucket(t.get("confidence") or 0.0))
+        for t in traits
+    )
+    return ResponseCache.make_key(json.dumps(canonical))
 
 # Utility to convert all datetimes in a dict/list to ISO strings
 def convert_datetimes(obj):
@@ -22,6 +62,17 @@ class RecommendationService:
         # Use backend/src/resources as base
         BASE_DIR = Path(__file__).resolve().parent.parent
         self.fields_of_study = self.load_fields_of_study(BASE_DIR)
+        # Pre-ranks courses locally so only the best candidates go to Gemini
+        self.index = CourseIndex(self.fields_of_study)
+        # Rendered once and placed first where it can be cached
+        self.static_prefix = self.build_static_prefix()
+        # Shared by every user with the same fingerprint
+        self.cache = ResponseCache(
+            "recommendation",
+            RECOMMENDATION_CACHE_TTL_SECONDS,
+            maxsize=RECOMMENDATION_CACHE_SIZE,
+            shared=settings.RECOMMENDATION_CACHE_SHARED
+        )
 
     def load_fields_of_study(self, base_dir):
         path = base_dir / "resources" / "field_of_study.txt"
@@ -43,26 +94,46 @@ class RecommendationService:
                     })
         return fields
 
-    def fields_text(self):
+    def fields_text(self, courses=None, short=False):
+        courses = self.fields_of_study if courses is None else courses
         return "\n".join([
-            f"- {f['course']}: {f['description']}" for f in self.fields_of_study
+            f"- {f['course']}: {self.short_description(f['description']) if short else f['description']}"
+            for f in courses
         ])
 
-    async def recommend_courses(self, user_profile: dict) -> list:
+    @staticmethod
+    def short_description(description: str) -> str:
+        sentence = description.split(". ", 1)[0].rstrip(".")
+        if len(sentence) > CANDIDATE_DESCRIPTION_CHARS:
+            sentence = sentence[:CANDIDATE_DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "..."
+        return sentence
+
+    def candidates(self, traits: list, k: int) -> list:
         """
-        Calls Gemini to recommend the 10 best-matching fields of study for the user profile.
-        Only sends the traits list from the profile document.
-        Returns a JSON array of objects with course, course_fit (1, 2, or 3), matched_traits, and reason.
+        Up to k courses that best match the traits by local TF-IDF score, or every course when k <= 0.
+        Only courses with some match are offered. When fewer than CANDIDATE_MIN_MATCHES courses match,
+        or even the best match is weak, the local ranking isn't trusted and the whole catalog is used.
         """
-        import asyncio
-        traits = user_profile.get("traits", [])
-        traits = convert_datetimes(traits)
-        logger.info(f"Generating recommendations for user with {len(traits)} traits")
+        if k <= 0 or k >= len(self.fields_of_study):
+            return list(self.fields_of_study)
+        ranked = [(score, i) for score, i in self.index.score(traits) if score > 0]
+        if len(ranked) < CANDIDATE_MIN_MATCHES or ranked[0][0] < CANDIDATE_MIN_TOP_SCORE:
+            metrics.incr("recommendation_candidates_fallback")
+            return list(self.fields_of_study)
+        return [self.fields_of_study[i] for _, i in ranked[:k]]
+
+    def build_prompt(self, traits: list, candidates: list) -> str:
+        # The full catalog keeps its full descriptions; a shortlist only needs enough to tell courses apart
+        short = len(candidates) < len(self.fields_of_study)
+        return (
+            f"Courses:\n{self.fields_text(candidates, short=short)}\n"
+            f"User traits: {json.dumps(traits)}"
+        )
 
-        prompt = (
-            "You are an educational advisor. Here is a list of courses and their descriptions:\n"
-            f"{self.fields_text()}\n"
-            "Given the following user's traits, recommend the 10 most relevant courses.\n"
+    def build_static_prefix(self):
+        return (
+            "You are an educational advisor. You will be given a list of courses with their descriptions, followed by a user's traits.\n"
+            "Recommend the 10 courses from that list that are most relevant to the user's traits.\n"
             "For each course, assign a relative fit category:\n"
             "- course_fit: 1 (best fit, top group), 2 (medium fit, middle group), or 3 (lower fit, bottom group).\n"
             "- There should be at least 2-3 courses in each fit group.\n"
@@ -83,24 +154,96 @@ class RecommendationService:
             "  },\n"
             "  ...\n"
             "]\n"
-            f"User traits: {json.dumps(traits)}"
         )
+
+    @staticmethod
+    def profile_traits(user_profile: dict) -> list:
+        """
+        Current label of each trait from the profile document, without its evidence history.
+        """
+        return [
+            {k: v for k, v in t.items() if k != "history"}
+            for t in (user_profile.get("traits") or {}).values()
+        ]
+
+    def fingerprint(self, user_profile: dict) -> str:
+        return trait_fingerprint(self.profile_traits(user_profile))
+
+    def recommend_locally(self, user_profile: dict) -> list:
+        """
+        Recommend up to 10 well-matching courses without calling Gemini: courses are ranked by
+        TF-IDF score against the traits, and weak matches are left out. A trait is listed in
+        matched_traits only when its label shares terms with the course, and the reason names those traits.
+        Same shape as the Gemini result, with source "local"; may be empty.
+        """
+        traits = self.profile_traits(user_profile)
+        ranked = self.index.score(traits)
+        best = ranked[0][0] if ranked else 0.0
+        ranked = [
+            (score, i) for score, i in ranked[:len(LOCAL_FIT_BY_RANK)]
+            if score >= LOCAL_MIN_SCORE and score >= best * LOCAL_RELATIVE_CUTOFF
+        ]
+        result = []
+        for rank, (_, i) in enumerate(ranked):
+            course = self.fields_of_study[i]
+            matched = [t["label"] for t in traits if t.get("label") and self.index.label_overlap(t, i)]
+            summary = self.short_description(course["description"]).rstrip(".")
+            if matched:
+                reason = f"{course['course']} matches what you told us ({', '.join(matched)}). {summary}."
+            else:
+                reason = f"{course['course']} is a broad match for what we know about you so far. {summary}."
+            result.append({
+                "course": course["course"],
+                "course_fit": LOCAL_FIT_BY_RANK[rank],
+                "matched_traits": matched,
+                "reason": reason,
+                "source": "local",
+            })
+        metrics.incr("recommendation_local")
+        return result
+
+    async def recommend_courses(self, user_profile: dict, candidates: Optional[int] = None, fallback: bool = True) -> list:
+        """
+        Calls Gemini to recommend the 10 best-matching fields of study for the user profile.
+        Only sends the current label of each trait from the profile document, not its evidence history.
+        Courses are pre-ranked locally and only the top `candidates` (default RECOMMENDATION_CANDIDATES,
+        0 for the whole catalog) are offered to Gemini.
+        Results are cached under the trait fingerprint and shared by every user with the same one.
+        If Gemini errors, returns nothing or takes longer than RECOMMENDATION_LATENCY_BUDGET_SECONDS,
+        the local recommendations are returned instead (or [] when `fallback` is False).
+        Returns a JSON array of objects with course, course_fit (1, 2, or 3), matched_traits, reason
+        and source ("llm" or "local").
+        """
+        k = settings.RECOMMENDATION_CANDIDATES if candidates is None else candidates
+        traits = self.profile_traits(user_profile)
+        fingerprint = ResponseCache.make_key(trait_fingerprint(traits), f"candidates={k}")
+        cached = await self.cache.get(fingerprint)
+        if cached:
+            metrics.incr("recommendation_llm_calls_saved", reason="cache")
+            logger.info(f"Recommendation cache hit for fingerprint {fingerprint[:12]}")
+            return cached
+
+        traits = convert_datetimes(traits)
+        logger.info(f"Generating recommendations for user with {len(traits)} traits")
+
+        shortlist = self.candidates(traits, k)
+        prompt = self.build_prompt(traits, shortlist)
         # Log the first 3-4 lines of the prompt for debugging
         # prompt_lines = prompt.split("\n")
         # logger.info("Prompt preview: %s", "\n".join(prompt_lines[:4]))
 
         try:
             logger.info("Calling Gemini API for course recommendations")
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.gemini.client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt,
+            response = await asyncio.wait_for(
+                self.gemini.generate(
+                    prompt,
+                    static_prefix=self.static_prefix,
+                    task="recommendation",
                     config={
                         "response_mime_type": "application/json",
                     },
-                )
+                ),
+                timeout=settings.RECOMMENDATION_LATENCY_BUDGET_SECONDS
             )
             result = response.parsed
             if result is None or not isinstance(result, list):
@@ -110,8 +253,27 @@ class RecommendationService:
                 except Exception:
                     result = []
 
+            # Keep only courses that were offered, in case Gemini names one outside the list
+            offered = {c["course"].lower() for c in shortlist}
+            result = [
+                {**r, "source": "llm"} for r in result
+                if isinstance(r, dict) and str(r.get("course", "")).lower() in offered
+            ]
             logger.debug(f"Recommendations: {result}")
-            return result
+            metrics.incr("recommendation_llm_calls")
+            if result:
+                await self.cache.set(fingerprint, result)
+                return result
+            reason = "empty"
+        except asyncio.TimeoutError:
+            logger.warning(f"Gemini recommendations exceeded the {settings.RECOMMENDATION_LATENCY_BUDGET_SECONDS}s budget")
+            reason = "timeout"
+        except LLMUnavailable:
+            reason = "unavailable"
         except Exception as e:
             logger.error("RecommendationService error: %s", e)
-            return [] 
\ No newline at end of file
+            reason = "error"
+        if not fallback:
+            return []
+        metrics.incr("recommendation_fallbacks", reason=reason)
+        return self.recommend_locally(user_profile) 
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Content-addressed cache for LLM results.
+An in-process LRU/TTL tier answers repeats within a process; an optional Mongo tier shares
+results across processes and users, with expiry left to a TTL index on the collection.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Optional
+import hashlib
+import logging
+from src.clients.mongo_client import get_database
+from src.core.cache import TTLCache
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, name: str, ttl_seconds: float, maxsize: int = 2048, shared: bool = False):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.collection = get_database()[f"{name}_cache"] if shared else None
+        self._index_ready = False
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            metrics.incr("cache_hits", cache=self.name, tier="memory")
+            return value
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            except Exception as e:
+                logger.warning(f"{self.name} cache read failed: {e}")
+                doc = None
+            if doc:
+                self.local.set(key, doc["value"])
+                metrics.incr("cache_hits", cache=self.name, tier="mongo")
+                return doc["value"]
+        metrics.incr("cache_misses", cache=self.name)
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        if self.collection is None:
+            return
+        try:
+            if not self._index_ready:
+                await self.collection.create_index("expires_at", expireAfterSeconds=0)
+                self._index_ready = True
+            await self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"{self.name} cache write failed: {e}")
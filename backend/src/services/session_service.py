@@ -0,0 +1,71 @@
+"""
+Server-side conversation sessions.
+Keeps each user's recent conversation window so clients can send only the new message and a session id
+instead of the whole conversation_history on every turn.
+"""
+from bson import ObjectId
+from src.core.cache import TTLCache
+from src.services.profile_service import ProfileService
+from src.models.pydantic.profile import ChatMessage
+from typing import Dict, Any, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent messages kept in a session window
+SESSION_WINDOW_SIZE = 20
+# Seconds a cached window stays valid without being used
+SESSION_TTL_SECONDS = 15 * 60
+SESSION_CACHE_SIZE = 2048
+
+
+class SessionService:
+    """
+    Caches the recent conversation window per user, in process, along with the number of stored
+    messages it reflects. Each use compares that count with the store's (a cheap server-side $size),
+    so when another process served the last turn, or the chat was cleared, the window is rebuilt
+    from the tail of the stored chat history. The message store stays the source of truth.
+    """
+    def __init__(self, window_size: int = SESSION_WINDOW_SIZE):
+        self.profile_service = ProfileService()
+        self.window_size = window_size
+        self.cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_TTL_SECONDS)
+
+    async def get_window(self, user_id: ObjectId, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Return a copy of the session's recent messages, oldest first, each with role and content.
+        """
+        entry = self.cache.get(str(user_id))
+        if entry is not None and entry["session_id"] == session_id:
+            if await self.profile_service.get_chat_history_length(user_id) != entry["count"]:
+                logger.debug(f"Session window for user_id={user_id} is stale, reloading")
+                entry = None
+        if entry is None or entry["session_id"] != session_id:
+            messages, start = await self.profile_service.get_chat_history_page(user_id, limit=self.window_size)
+            entry = {
+                "session_id": session_id,
+                "window": [self._to_turn(m) for m in messages],
+                "count": (start or 0) + len(messages),
+            }
+            self.cache.set(str(user_id), entry)
+            logger.debug(f"Loaded session window for user_id={user_id} ({len(messages)} messages)")
+        return list(entry["window"])
+
+    def record(self, user_id: ObjectId, session_id: str, messages: List[ChatMessage]) -> None:
+        """
+        Append messages that have just been written to the store to the cached window.
+        """
+        entry = self.cache.get(str(user_id))
+        if entry is None or entry["session_id"] != session_id:
+            return
+        entry["window"].extend(self._to_turn(m) for m in messages)
+        entry["count"] += len(messages)
+        del entry["window"][:-self.window_size]
+        self.cache.set(str(user_id), entry)
+
+    def forget(self, user_id: ObjectId) -> None:
+        self.cache.pop(str(user_id))
+
+    @staticmethod
+    def _to_turn(message: ChatMessage) -> Dict[str, Any]:
+        return {"role": message.role, "content": message.content}
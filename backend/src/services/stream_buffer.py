@@ -0,0 +1,101 @@
+"""
+Server-side buffers for chat reply streams, so a client whose connection drops can reconnect
+and receive the rest of the reply without a new Gemini call.
+Each stream's events are kept in order with sequence numbers (starting at 1) for
+STREAM_BUFFER_TTL_SECONDS after the stream was last written to. Generation runs independently
+of the connection; it is only cancelled once no client has been attached for
+STREAM_RESUME_GRACE_SECONDS. Buffers live in this process, so a reconnect must reach the same
+instance.
+"""
+from typing import List, Optional, Tuple
+from bson import ObjectId
+import asyncio
+import time
+import uuid
+from src.core.cache import TTLCache
+from src.core.metrics import metrics
+
+STREAM_BUFFER_TTL_SECONDS = 300
+STREAM_BUFFER_MAX_STREAMS = 1024
+# How long generation continues with no client attached before it is cancelled
+STREAM_RESUME_GRACE_SECONDS = 15
+
+
+class StreamBuffer:
+    def __init__(self, stream_id: str, user_id: ObjectId):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.events: List[Tuple[int, str, dict]] = []
+        self.done = False
+        self.cancel_event = asyncio.Event()
+        self.consumers = 0
+        self.detached_at: Optional[float] = time.monotonic()
+        self.producer: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, event: str, data: dict) -> int:
+        seq = len(self.events) + 1
+        self.events.append((seq, event, data))
+        self._notify()
+        return seq
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def since(self, seq: int) -> List[Tuple[int, str, dict]]:
+        return self.events[max(seq, 0):]
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """
+        Wait up to `timeout` for an event after `seq` or the end of the stream.
+        Returns False on timeout.
+        """
+        if len(self.events) > seq or self.done:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def attach(self) -> None:
+        self.consumers += 1
+        self.detached_at = None
+
+    def detach(self) -> None:
+        self.consumers -= 1
+        if self.consumers <= 0:
+            self.consumers = 0
+            self.detached_at = time.monotonic()
+
+    def abandoned(self) -> bool:
+        return self.detached_at is not None and time.monotonic() - self.detached_at > STREAM_RESUME_GRACE_SECONDS
+
+
+class StreamRegistry:
+    def __init__(self):
+        self.buffers = TTLCache(maxsize=STREAM_BUFFER_MAX_STREAMS, ttl=STREAM_BUFFER_TTL_SECONDS)
+
+    def create(self, user_id: ObjectId) -> StreamBuffer:
+        buffer = StreamBuffer(uuid.uuid4().hex, user_id)
+        self.buffers.set(buffer.stream_id, buffer)
+        metrics.incr("stream_buffers_created")
+        return buffer
+
+    def touch(self, buffer: StreamBuffer) -> None:
+        # Keep a buffer for the full TTL after its last event
+        self.buffers.set(buffer.stream_id, buffer)
+
+    def get(self, stream_id: str, user_id: ObjectId) -> Optional[StreamBuffer]:
+        buffer = self.buffers.get(stream_id)
+        if buffer is None or buffer.user_id != user_id:
+            return None
+        return buffer
+
+
+stream_registry = StreamRegistry()
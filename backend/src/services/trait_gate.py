@@ -0,0 +1,104 @@
+"""
+Cheap local pre-check run before trait evaluation.
+Decides whether a user message could carry trait information at all (so "ok", "thanks", "hi"
+or a lone emoji never reach Gemini) and, when it can, which traits it most likely speaks to,
+so the evaluation prompt can be narrowed to them.
+Rules handle the obvious cases; a keyword classifier over the trait manifest picks the traits.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import re
+from src.services.course_index import tokenize
+
+GREETINGS = frozenset([
+    "hi", "hello", "hey", "hiya", "yo", "hai", "good morning", "good afternoon", "good evening",
+    "hi there", "hello there", "hey there",
+])
+# Messages that never say anything about a trait, whatever was asked
+ACKNOWLEDGEMENTS = GREETINGS | frozenset([
+    "ok", "okay", "k", "kk", "okie", "alright", "cool", "nice", "great", "awesome", "noted",
+    "thanks", "thank you", "thanks a lot", "thank u", "thx", "ty", "tq", "cheers",
+    "bye", "goodbye", "see you", "cya", "gtg",
+    "lol", "haha", "hahaha", "hehe", "lmao", "hmm", "hm", "mm", "uh", "um", "ah", "oh", "wow",
+    "ok thanks", "okay thanks", "ok thank you", "okay thank you", "cool thanks", "great thanks",
+])
+LETTER_RE = re.compile(r"[^\W\d_]")
+# Traits scoring at least this share of the best score are kept, up to MAX_TRAITS
+RELATIVE_SCORE_CUTOFF = 0.5
+MAX_TRAITS = 3
+# Once the answer itself points at traits, the assistant's question helps rank them, counting for less
+TURN_WEIGHT = 0.5
+DESCRIPTION_WEIGHT = 0.5
+
+# Hand-picked cues per trait, on top of the words in each trait's manifest description
+TRAIT_KEYWORDS = {
+    "learning_style": "learn learning visual video videos diagram diagrams listen listening lecture lectures read reading books "
+                      "hands-on practical practice experiment experiments notes watch examples explain explanation understand",
+    "motivation": "motivate motivated motivation passion passionate curious curiosity grades compete competition recognition "
+                  "proud parents drive driven inspire inspired enjoy satisfaction reward",
+    "goal": "become career job jobs work future dream profession engineer doctor lawyer teacher nurse business company "
+            "startup designer developer scientist architect accountant pilot entrepreneur",
+    "academic_strengths": "math maths mathematics science physics chemistry biology english writing art arts design history "
+                          "geography economics accounting computer coding programming subject subjects strong favourite favorite "
+                          "excel best marks",
+    "decision_driver": "prestige ranking rankings reputation affordable affordability campus location facilities facility "
+                       "student life quality important matters priority choose choice",
+    "financial_need_level": "money afford budget cost costs fee fees scholarship scholarships loan ptptn expensive cheap "
+                            "financial aid pay income tight savings",
+    "geographic_openness": "abroad overseas home local city country travel move moving far near nearby hometown hostel away "
+                           "australia britain kingdom singapore japan korea europe america kuala lumpur penang johor",
+    "personality_orientation": "introvert introverted extrovert extroverted ambivert alone people social friends quiet party "
+                               "group groups team recharge shy outgoing",
+    "brand_affinity": "university universities brand famous top monash taylor taylors sunway nottingham ukm upm usm utm "
+                      "apu ucsi harvard oxford cambridge ivy",
+}
+
+
+def normalize_message(text: str) -> str:
+    # Lowercase, with punctuation and emoji dropped, so "Hi!" and "hi 👋" compare equal to "hi"
+    return " ".join(re.sub(r"[^\w\s'-]", " ", (text or "").lower()).split())
+
+
+@dataclass
+class GateDecision:
+    informative: bool
+    # Likeliest traits, best first; None when the message doesn't point at any in particular
+    traits: Optional[List[str]] = None
+    reason: str = ""
+
+
+class TraitGate:
+    def __init__(self, trait_manifest: List[dict]):
+        self.trait_keys = [t["trait"] for t in trait_manifest]
+        self.weights: Dict[str, Dict[str, float]] = {}
+        for t in trait_manifest:
+            weights = {token: DESCRIPTION_WEIGHT for token in tokenize(t["description"])}
+            for token in tokenize(TRAIT_KEYWORDS.get(t["trait"], "")):
+                weights[token] = 1.0
+            self.weights[t["trait"]] = weights
+
+    def scores(self, text: str) -> Dict[str, float]:
+        tokens = tokenize(text or "")
+        return {
+            trait: sum(weights.get(token, 0.0) for token in tokens)
+            for trait, weights in self.weights.items()
+        }
+
+    def classify(self, turn: Optional[str], answer: str) -> GateDecision:
+        normalized = normalize_message(answer)
+        if not LETTER_RE.search(answer or ""):
+            return GateDecision(False, reason="no_text")
+        if normalized in ACKNOWLEDGEMENTS:
+            return GateDecision(False, reason="acknowledgement")
+
+        # Anything else may be a terse answer ("Medicine"), even to a prompt that isn't phrased as a question
+        answer_scores = self.scores(answer)
+        turn_scores = self.scores(turn or "")
+        if not any(answer_scores.values()):
+            # The question alone is too weak a hint to rule traits out; evaluate against all of them
+            return GateDecision(True)
+        combined = {t: answer_scores[t] + TURN_WEIGHT * turn_scores[t] for t in self.trait_keys}
+        best = max(combined.values())
+        ranked = sorted(self.trait_keys, key=lambda t: -combined[t])
+        traits = [t for t in ranked if combined[t] >= best * RELATIVE_SCORE_CUTOFF][:MAX_TRAITS]
+        return GateDecision(True, traits=traits)
@@ -0,0 +1,119 @@
+"""
+Standalone worker that drains the recommendation job queue.
+
+Run continuously:
+    python -m src.workers.recommendation_worker
+Drain one batch and exit (e.g. from cron):
+    python -m src.workers.recommendation_worker --once --batch-size 20
+On AWS Lambda, point a scheduled rule at `src.workers.recommendation_worker.handler`.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+from src.services.orchestrator_service import OrchestratorService
+from src.services.recommendation_queue import RecommendationJobQueue
+from src.core.metrics import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_CONCURRENCY = 2
+IDLE_POLL_SECONDS = 5
+
+
+class RecommendationWorker:
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, concurrency: int = DEFAULT_CONCURRENCY):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.queue = RecommendationJobQueue()
+        self.orchestrator = OrchestratorService()
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run_job(self, job: dict) -> None:
+        user_id = job["_id"]
+        started = time.perf_counter()
+        try:
+            profile = await self.orchestrator.profile_service.get_profile(user_id, include_chat_history=False)
+            if profile is not None:
+                await self.orchestrator.refresh_recommendations(user_id, profile)
+        except Exception as e:
+            metrics.incr("recommendation_jobs_failed")
+            logger.warning(f"Recommendation job for user_id={user_id} failed (attempt {job.get('attempts')}): {e}")
+            await self.queue.fail(job, str(e))
+            return
+        await self.queue.complete(job)
+        metrics.incr("recommendation_jobs_completed")
+        metrics.observe("recommendation_job_seconds", time.perf_counter() - started)
+
+    async def drain_batch(self) -> int:
+        """
+        Run up to batch_size due jobs, `concurrency` at a time. A job is claimed only once a slot
+        is free, so its lease starts when it actually runs.
+        Returns the number of jobs claimed.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        for _ in range(self.batch_size):
+            await semaphore.acquire()
+            job = await self.queue.claim(self.name)
+            if job is None:
+                semaphore.release()
+                break
+
+            async def run(job=job):
+                try:
+                    await self.run_job(job)
+                finally:
+                    semaphore.release()
+            tasks.append(asyncio.create_task(run()))
+        if tasks:
+            await asyncio.gather(*tasks)
+            logger.info(f"Processed {len(tasks)} recommendation jobs")
+        return len(tasks)
+
+    async def run_forever(self) -> None:
+        await self.queue.ensure_indexes()
+        logger.info(f"Recommendation worker {self.name} started")
+        while True:
+            processed = await self.drain_batch()
+            if processed < self.batch_size:
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+
+
+# The Mongo client and the services' asyncio primitives are created once per process and bind to
+# the first loop that uses them, so every invocation in a warm container must run on the same loop
+_loop = None
+_worker = None
+
+
+def handler(event, context):
+    """
+    Lambda entry point: drain a single batch.
+    """
+    global _loop, _worker
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+        _worker = RecommendationWorker()
+    processed = _loop.run_until_complete(_worker.drain_batch())
+    return {"processed": processed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--once", action="store_true", help="Drain one batch and exit")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    worker = RecommendationWorker(args.batch_size, args.concurrency)
+    if args.once:
+        asyncio.run(worker.drain_batch())
+    else:
+        asyncio.run(worker.run_forever())
@@ -176,9 +176,18 @@ const ChatMessage = memo(function ChatMessage({ message }: { message: Message })
   );
 });
 
+// Messages fetched per history page; older pages are loaded on request
+const HISTORY_PAGE_SIZE = 50;
+
 export default function Chat() {
   const { setTitle } = usePageTitle();
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const scrollContainerRef = useRef<HTMLDivElement>(null);
+  // Cursor for the next older page of history, null once everything is loaded
+  const [olderCursor, setOlderCursor] = useState<number | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+  // Set while older messages are prepended, so the view doesn't jump to the bottom
+  const skipScrollRef = useRef(false);
   const { messages, setMessages, isLoadingHistory, setIsLoadingHistory } = useChatContext();
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
@@ -295,6 +304,10 @@ export default function Chat() {
 
   // Auto-scroll to bottom when messages change
   useEffect(() => {
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     if (messagesEndRef.current) {
       // Use smooth scroll only on first load after reload
       const behavior = firstLoadRef.current && !isLoadingHistory ? 'smooth' : 'auto';
@@ -305,29 +318,41 @@ export default function Chat() {
     }
   }, [messages, isLoadingHistory]);
 
+  // Fetch one page of history: the newest page, or the page before `before`
+  const fetchHistoryPage = async (before?: number) => {
+    const token = await getValidAccessToken();
+    if (!token) throw new Error('Not authenticated');
+    const params = new URLSearchParams({ limit: String(HISTORY_PAGE_SIZE) });
+    if (before !== undefined) params.set('before', String(before));
+    const response = await fetch(`${API_BASE_URL}/api/v1/orchestrator/history?${params}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+    if (!response.ok) return null;
+    const data = await response.json();
+    const nextBefore: number | null = data.next_before ?? null;
+    // The page starts at position nextBefore (0 for the oldest page), which keeps ids unique across pages
+    const start = nextBefore ?? 0;
+    const pageMessages: Message[] = data.conversations.map((msg: any, index: number) => {
+      return {
+        id: start + index,
+        text: msg.content,
+        isUser: msg.role === 'user',
+        timestamp: new Date(msg.timestamp),
+        alert: Array.isArray(msg.alert) ? msg.alert : [],
+      };
+    });
+    return { messages: pageMessages, nextBefore };
+  };
+
   const loadChatHistory = async () => {
     try {
       setIsLoadingHistory(true);
-      const token = await getValidAccessToken();
-      if (!token) throw new Error('Not authenticated');
-      const response = await fetch(`${API_BASE_URL}/api/v1/orchestrator/history`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-
-      if (response.ok) {
-        const data = await response.json();
-        const historyMessages: Message[] = data.conversations.map((msg: any, index: number) => {
-          return {
-            id: index,
-            text: msg.content,
-            isUser: msg.role === 'user',
-            timestamp: new Date(msg.timestamp),
-            alert: Array.isArray(msg.alert) ? msg.alert : [],
-          };
-        });
-        setMessages(historyMessages);
+      const page = await fetchHistoryPage();
+      if (page) {
+        setMessages(page.messages);
+        setOlderCursor(page.nextBefore);
       }
     } catch (error) {
       console.error('Failed to load chat history:', error);
@@ -336,6 +361,31 @@ export default function Chat() {
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (olderCursor === null || isLoadingOlder) return;
+    try {
+      setIsLoadingOlder(true);
+      const page = await fetchHistoryPage(olderCursor);
+      if (page) {
+        // Keep the messages the user is looking at in place after prepending
+        const container = scrollContainerRef.current;
+        const previousHeight = container?.scrollHeight ?? 0;
+        skipScrollRef.current = true;
+        setMessages(prev => [...page.messages, ...prev]);
+        setOlderCursor(page.nextBefore);
+        requestAnimationFrame(() => {
+          if (container) {
+            container.scrollTop += container.scrollHeight - previousHeight;
+          }
+        });
+      }
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!inputValue.trim() || isLoading) return;
 
@@ -434,8 +484,20 @@ export default function Chat() {
   return (
     <div className="flex-1 flex flex-col min-h-0">
       {/* Messages Area */}
-      <div className="flex-1 overflow-y-auto">
+      <div ref={scrollContainerRef} className="flex-1 overflow-y-auto">
         <div className="max-w-3xl mx-auto px-4 pt-6 pb-2 space-y-4">
+          {olderCursor !== null && (
+            <div className="text-center">
+              <button
+                type="button"
+                onClick={loadOlderMessages}
+                disabled={isLoadingOlder}
+                className="text-sm text-muted-foreground hover:text-foreground disabled:opacity-50"
+              >
+                {isLoadingOlder ? 'Loading earlier messages…' : 'Load earlier messages'}
+              </button>
+            </div>
+          )}
           {messages.length === 0 && (
             <div className="text-center text-muted-foreground py-8">
               <p className="text-lg">Hello! I'm your study advisor. How can I help you today?</p>